@@ -0,0 +1,133 @@
+'''
+Batch carving of many image files on a process pool.
+
+carve_files spreads the images over worker processes (largest first, so a big
+image is not left running alone at the end) and yields one result per image as
+soon as it finishes; images that fail are reported and skipped. This is what
+the seamcarve.py command line runs for --batch. The results keep their paths
+relative to the deepest directory holding all the images (see output_names), so
+images with the same name in different directories do not overwrite each other.
+'''
+import glob
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.gif', '.tif', '.tiff', '.webp')
+
+
+def collect_images(pattern: str) -> list:
+    '''
+    Returns:
+    the image files in the directory pattern, or the files matching the glob
+    pattern (e.g. seamcarve_images/*.png), sorted by name
+    '''
+    if os.path.isdir(pattern):
+        return sorted(os.path.join(pattern, name) for name in os.listdir(pattern)
+                      if name.lower().endswith(IMAGE_EXTENSIONS))
+    return sorted(path for path in glob.glob(pattern) if os.path.isfile(path))
+
+
+def pixel_count(path: str) -> int:
+    '''
+    Returns:
+    width * height of the image at path, read from its header only
+    (0 if it cannot be read; it will fail again, and be reported, when carved)
+    '''
+    from PIL import Image
+    try:
+        with Image.open(path) as image:
+            return image.width * image.height
+    except Exception:
+        return 0
+
+
+def output_names(paths) -> dict:
+    '''
+    Returns:
+    each path's name relative to the deepest directory that holds all of
+    paths (e.g. a/x.png and b/x.png for imgs/a/x.png and imgs/b/x.png), which
+    tells apart any two different files
+    '''
+    if not paths:
+        return {}
+    root = os.path.commonpath([os.path.dirname(os.path.abspath(path)) for path in paths])
+    return {path: os.path.relpath(os.path.abspath(path), root) for path in paths}
+
+
+def carve_file(path: str, output_dir: str, target_width: int = None, seam_count: int = None,
+               workers: int = 1, energy_mode: str = 'backward', profile: bool = False,
+               name: str = None) -> dict:
+    '''
+    Carves one image file and writes the result to output_dir under the same name
+
+    Parameters:
+    target_width, seam_count -- either the width to carve to (inserting seams if it is wider)
+     or the number of seams to remove
+    workers -- threads per image (see SeamCarve.workers)
+    energy_mode -- see SeamCarve.energy_mode
+    profile -- time the stages with a profiling.CarveStats
+    name -- the result's path relative to output_dir, if not the file's own
+     name (its directories are created as needed)
+
+    Returns:
+    a dict with the 'output' path, the carved 'shape' and the 'seconds' taken,
+    plus the CarveStats.summary() as 'stats' if profile is set
+    '''
+    from PIL import Image
+    from seamcarve import SeamCarve
+    from profiling import CarveStats
+    start = time.perf_counter()
+    stats = CarveStats() if profile else None
+    seam_carve = SeamCarve(path, stats)
+    seam_carve.workers = workers
+    seam_carve.energy_mode = energy_mode
+    if seam_count is None:
+        seam_count = seam_carve.image_width - target_width
+    if seam_count < 0:
+        carved_array, seams = seam_carve.insert_seams(-seam_count)
+    else:
+        carved_array, seams = seam_carve.carve_seams(seam_count)
+    output = os.path.join(output_dir, os.path.basename(path) if name is None else name)
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with seam_carve.stats.stage('encode'):
+        Image.fromarray(carved_array).save(output)
+    result = {'output': output, 'shape': carved_array.shape, 'seconds': time.perf_counter() - start}
+    if profile:
+        result['stats'] = stats.summary()
+    return result
+
+
+def carve_files(paths, output_dir: str, target_width: int = None, seam_count: int = None,
+                processes: int = None, workers: int = 1, energy_mode: str = 'backward',
+                profile: bool = False):
+    '''
+    Carves image files on a process pool, largest images first
+
+    Parameters:
+    paths -- the image files
+    output_dir -- where the results are written (created if needed), under
+     their output_names
+    target_width, seam_count, workers, energy_mode, profile -- see carve_file
+    processes -- pool size (defaults to the number of CPUs)
+
+    Yields:
+    one dict per image, in completion order, with its 'path' and either the
+    carve_file results or the 'error' that made it fail
+    '''
+    if (target_width is None) == (seam_count is None):
+        raise ValueError("give exactly one of target_width and seam_count")
+    os.makedirs(output_dir, exist_ok=True)
+    names = output_names(paths)
+    paths = sorted(names, key=pixel_count, reverse=True)
+    with ProcessPoolExecutor(processes) as pool:
+        futures = {pool.submit(carve_file, path, output_dir, target_width, seam_count,
+                               workers, energy_mode, profile, names[path]): path
+                   for path in paths}
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as error:
+                result = {'error': '%s: %s' % (type(error).__name__, error)}
+            result['path'] = futures[future]
+            yield result
@@ -0,0 +1,309 @@
+'''
+Benchmarks for the carving pipeline.
+
+Run as a script to print the results as JSON, e.g.
+    python benchmark.py pipeline --sizes 64 256 1024 4096 --contents flat noise edges
+    python benchmark.py pyramid --sizes 512 1024 --levels 3 --half-width 4
+    python benchmark.py parallel --sizes 1024 4096 --workers 1 2 4 8
+    python benchmark.py batched --sizes 512 1024 --seams 100 --seams-per-pass 1 4 16
+'''
+import argparse
+import json
+import time
+import tracemalloc
+import numpy as np
+from importance_calculator import ImportanceCalculator, energy_map
+from pyramid import pyramid_seam
+from seam_dp import fill_rows
+
+CONTENTS = ('flat', 'noise', 'edges', 'mixed')
+
+
+def synthetic_image(size: int, seed: int = 0) -> np.ndarray:
+    '''
+    A reproducible size x size RGB test image: smooth gradients with a few
+    random rectangles (hard edges) and some noise
+    '''
+    rng = np.random.default_rng(seed)
+    ramp = np.linspace(0, 160, size)
+    image = np.empty((size, size, 3))
+    image[:, :, 0] = ramp[None, :]
+    image[:, :, 1] = ramp[:, None]
+    image[:, :, 2] = 80
+    for ignored in range(8):
+        top, left = rng.integers(0, size, 2)
+        image[top:top + size // 6, left:left + size // 6] = rng.integers(0, 256, 3)
+    image += rng.normal(0, 4, image.shape)
+    return np.clip(image, 0, 255).astype(np.uint8)
+
+
+def content_image(size: int, content: str, seed: int = 0) -> np.ndarray:
+    '''
+    A reproducible size x size RGB test image of one kind of content:
+    'flat' (one color, no importance anywhere), 'noise' (uniform random
+    pixels), 'edges' (flat rectangles with hard edges and nothing else) or
+    'mixed' (see synthetic_image)
+    '''
+    rng = np.random.default_rng(seed)
+    if content == 'flat':
+        return np.full((size, size, 3), 128, dtype=np.uint8)
+    if content == 'noise':
+        return rng.integers(0, 256, (size, size, 3), dtype=np.uint8)
+    if content == 'edges':
+        image = np.zeros((size, size, 3), dtype=np.uint8)
+        for ignored in range(16):
+            top, left = rng.integers(0, size, 2)
+            height, width = rng.integers(1, size // 3 + 2, 2)
+            image[top:top + height, left:left + width] = rng.integers(0, 256, 3)
+        return image
+    if content == 'mixed':
+        return synthetic_image(size, seed)
+    raise ValueError("content must be one of %s, got %r" % (CONTENTS, content))
+
+
+def timed(function, *args):
+    '''
+    Returns:
+    a (result, seconds) tuple for one call of function(*args)
+    '''
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def measured(function, *args) -> dict:
+    '''
+    Runs function(*args) twice: once timed, once under tracemalloc for its
+     peak memory (NumPy reports its buffers to tracemalloc, so arrays count)
+
+    Returns:
+    a dict with the 'seconds' taken and the 'peak_bytes' allocated on top of
+    what was already allocated
+    '''
+    ignored, seconds = timed(function, *args)
+    tracemalloc.start()
+    try:
+        function(*args)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {'seconds': seconds, 'peak_bytes': peak}
+
+
+def carve_loop(image, seam_count: int):
+    '''
+    The full multi-seam loop (SeamCarve.carve_seams) on a fresh SeamCarve
+    '''
+    from seamcarve import SeamCarve
+    return SeamCarve.from_array(image).carve_seams(seam_count)
+
+
+def benchmark_pipeline(sizes, contents=CONTENTS, seam_count: int = 10,
+                       reference_max_size: int = 256, seed: int = 0) -> list:
+    '''
+    Times each stage of the carving pipeline and measures its peak memory:
+    'importance_reference' (ImportanceCalculator.calculate_importance_values,
+    the per-pixel original, only up to reference_max_size as it takes minutes
+    on large images), 'importance_array' (energy_map), 'fill_costs_dirs',
+    'find_least_important_seam' and 'carve_seams' (seam_count seams, or as
+    many as the image allows)
+
+    Returns:
+    one dict per (size, content, stage), see measured
+    '''
+    from seamcarve import SeamCarve
+    results = []
+    for size in sizes:
+        for content in contents:
+            image = content_image(size, content, seed)
+            seam_carve = SeamCarve.from_array(image)
+            vals = energy_map(image)
+            stages = [
+                ('importance_array', energy_map, image),
+                ('fill_costs_dirs', seam_carve.fill_costs_dirs, vals),
+                ('find_least_important_seam', seam_carve.find_least_important_seam, vals),
+                ('carve_seams', carve_loop, image, min(seam_count, size - 1)),
+            ]
+            if size <= reference_max_size:
+                stages.insert(0, ('importance_reference',
+                                  ImportanceCalculator(image).calculate_importance_values))
+            for stage, function, *args in stages:
+                results.append(dict({'size': size, 'content': content, 'stage': stage},
+                                    **measured(function, *args)))
+    return results
+
+
+def exact_seam(image):
+    '''
+    The production seam search: SeamCarve.find_least_important_seam on the
+    energy_map of image
+
+    Returns:
+    a (seam, cost) tuple, as for pyramid.banded_seam
+    '''
+    from seamcarve import SeamCarve
+    vals = energy_map(image)
+    seam = SeamCarve.from_array(image).find_least_important_seam(vals)
+    return seam, float(vals[np.arange(len(seam)), seam].sum())
+
+
+def benchmark_pyramid(sizes, levels: int = 3, half_width: int = 4, seed: int = 0) -> list:
+    '''
+    Compares one pyramid_seam search with the exact full resolution seam
+     (see exact_seam)
+
+    Returns:
+    one dict per size with both timings, the speedup and the seam costs
+    (cost_gap is how much more importance the pyramid seam removes, relative
+    to the exact seam)
+    '''
+    results = []
+    for size in sizes:
+        image = synthetic_image(size, seed)
+        (ignored, exact_cost), exact_time = timed(exact_seam, image)
+        (ignored, cost), pyramid_time = timed(pyramid_seam, image, levels, half_width)
+        results.append({
+            'size': size,
+            'levels': levels,
+            'half_width': half_width,
+            'exact_seconds': exact_time,
+            'pyramid_seconds': pyramid_time,
+            'speedup': exact_time / pyramid_time,
+            'exact_cost': exact_cost,
+            'pyramid_cost': cost,
+            'cost_gap': (cost - exact_cost) / exact_cost if exact_cost else 0.0,
+        })
+    return results
+
+
+def fill_tables(vals, workers: int):
+    '''
+    Returns:
+    the (costs, dirs) tables of SeamCarve.fill_costs_dirs for vals
+    '''
+    costs = np.empty(vals.shape)
+    dirs = np.empty((vals.shape[0] - 1, vals.shape[1]), dtype=np.int8)
+    costs[-1] = vals[-1]
+    fill_rows(vals, costs, dirs, workers)
+    return costs, dirs
+
+
+def benchmark_parallel(sizes, worker_counts, seed: int = 0) -> list:
+    '''
+    Times the importance values and the DP tables with each worker count
+
+    Returns:
+    one dict per (size, workers) pair with both timings, their speedup over
+    one worker, and whether the outputs are identical to the one worker run
+    '''
+    results = []
+    for size in sizes:
+        image = synthetic_image(size, seed)
+        baseline = None
+        for workers in worker_counts:
+            vals, energy_time = timed(energy_map, image, workers)
+            (costs, dirs), dp_time = timed(fill_tables, vals, workers)
+            if baseline is None:
+                baseline = (vals, costs, dirs, energy_time, dp_time)
+            results.append({
+                'size': size,
+                'workers': workers,
+                'energy_seconds': energy_time,
+                'dp_seconds': dp_time,
+                'energy_speedup': baseline[3] / energy_time,
+                'dp_speedup': baseline[4] / dp_time,
+                'identical': bool((vals == baseline[0]).all() and (costs == baseline[1]).all()
+                                  and (dirs == baseline[2]).all()),
+            })
+    return results
+
+
+def benchmark_batched(sizes, seams_per_pass=(1, 2, 4, 8, 16), seam_count: int = 100,
+                      seed: int = 0) -> list:
+    '''
+    Carves seam_count seams with each seams_per_pass (see SeamCarve.iter_carve),
+    the first one being the baseline (normally 1, exact sequential carving)
+
+    Returns:
+    one dict per (size, seams_per_pass) pair with the time, its speedup over
+    the baseline and the total importance removed (cost_gap is how much more
+    than the baseline's, relative to it)
+    '''
+    from seamcarve import SeamCarve
+    results = []
+    for size in sizes:
+        image = synthetic_image(size, seed)
+        baseline = None
+        for per_pass in seams_per_pass:
+            seam_carve = SeamCarve.from_array(image)
+            ignored, seconds = timed(seam_carve.carve_seams, min(seam_count, size - 1), None, per_pass)
+            cost = sum(seam_carve.seam_costs)
+            if baseline is None:
+                baseline = (seconds, cost)
+            results.append({
+                'size': size,
+                'seams_per_pass': per_pass,
+                'seconds': seconds,
+                'speedup': baseline[0] / seconds,
+                'cost': cost,
+                'cost_gap': (cost - baseline[1]) / baseline[1] if baseline[1] else 0.0,
+            })
+    return results
+
+
+def slower_batches(results) -> list:
+    '''
+    Returns:
+    the benchmark_batched results of more than one seam per pass that were
+    not faster than their baseline
+    '''
+    return [result for result in results if result['seams_per_pass'] > 1 and result['speedup'] <= 1]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="benchmarks for the seam carving pipeline",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument('suite', choices=['pipeline', 'pyramid', 'parallel', 'batched'],
+                        help='''Which benchmark to run''')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[256, 512, 1024],
+                        help='''Side lengths of the square test images''')
+    parser.add_argument('--seed', type=int, default=0, help='''Seed for the test images''')
+    parser.add_argument('--contents', nargs='+', choices=CONTENTS, default=list(CONTENTS),
+                        help='''Image contents for the pipeline benchmark''')
+    parser.add_argument('--seams', type=int, default=10,
+                        help='''Seams removed by the pipeline and batched benchmarks' carving loops''')
+    parser.add_argument('--reference-max-size', type=int, default=256,
+                        help='''Largest size the per-pixel reference importance values run at''')
+    parser.add_argument('--levels', type=int, default=3, help='''Pyramid levels''')
+    parser.add_argument('--half-width', type=int, default=4,
+                        help='''Band half width of the pyramid search''')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8],
+                        help='''Worker counts for the parallel benchmark''')
+    parser.add_argument('--seams-per-pass', type=int, nargs='+', default=[1, 2, 4, 8, 16],
+                        help='''Batch sizes for the batched benchmark (the first is the baseline;
+                        if it is 1, the run fails unless every larger batch is faster)''')
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.suite == 'pipeline':
+        results = benchmark_pipeline(args.sizes, args.contents, args.seams,
+                                     args.reference_max_size, args.seed)
+    elif args.suite == 'pyramid':
+        results = benchmark_pyramid(args.sizes, args.levels, args.half_width, args.seed)
+    elif args.suite == 'parallel':
+        results = benchmark_parallel(args.sizes, args.workers, args.seed)
+    elif args.suite == 'batched':
+        results = benchmark_batched(args.sizes, args.seams_per_pass, args.seams, args.seed)
+    print(json.dumps(results, indent=2))
+    if args.suite == 'batched' and args.seams_per_pass[0] == 1:
+        #batching gives up some quality for speed, so it must at least be faster
+        slower = slower_batches(results)
+        for result in slower:
+            print("FAILED: %d seams per pass took %.2fx the time of sequential carving at size %d"
+                  % (result['seams_per_pass'], 1 / result['speedup'], result['size']))
+        if slower:
+            raise SystemExit(1)
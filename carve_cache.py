@@ -0,0 +1,205 @@
+'''
+A cache of carving results for images that are carved to the same sizes again.
+
+Results are keyed by a hash of the image's content plus the target size and
+energy mode, and kept in an in-memory LRU within a byte budget. An optional
+cache directory adds an on-disk tier of compressed .npz files, shared between
+processes and runs, which also keeps each image's importance values so that
+carving it to a new size skips that pass.
+
+CarveCache.carve_file hashes the file's bytes before decoding anything, so a
+hit neither decodes the image nor touches SeamCarve.
+'''
+import hashlib
+import io
+import os
+import tempfile
+from collections import OrderedDict
+import numpy as np
+from profiling import NULL_STATS
+
+
+def content_hash(data) -> str:
+    '''
+    Returns:
+    the hex digest of data: the bytes of an image file, or an image array
+    (whose shape and dtype are hashed along with its pixels)
+    '''
+    digest = hashlib.blake2b(digest_size=20)
+    if isinstance(data, np.ndarray):
+        digest.update(('%s%s' % (data.shape, data.dtype)).encode())
+        data = np.ascontiguousarray(data)
+    digest.update(memoryview(data).cast('B'))
+    return digest.hexdigest()
+
+
+class CarveCache:
+    '''
+    Carving results keyed by (content hash, target size, energy mode).
+
+    Cached arrays are read only and shared between callers; copy one before
+    changing it. hits, misses (computed results), disk_hits (hits served from
+    the cache directory, counted in hits too) and evictions (results dropped
+    from memory) count the lookups, and are also added to stats as the
+    'cache_hits', 'cache_misses' and 'cache_evictions' counters.
+    '''
+    def __init__(self, memory_budget: int = 256 * 2**20, cache_dir: str = None, stats=None):
+        '''
+        Parameters:
+        memory_budget -- bytes of results kept in memory (least recently used
+         ones are evicted first; a result larger than this is not kept in memory)
+        cache_dir -- directory of the on-disk tier (created if needed), or None
+        stats -- a profiling.CarveStats for the counters and for the carving itself
+        '''
+        self.memory_budget = memory_budget
+        self.cache_dir = cache_dir
+        self.stats = NULL_STATS if stats is None else stats
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+        self.entries = OrderedDict()
+        self.memory_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self.evictions = 0
+
+    def key(self, digest: str, target_width: int, target_height: int = None,
+            energy_mode: str = 'backward') -> str:
+        '''
+        Returns:
+        the cache key of the image with the given content hash carved to
+        target_width (and target_height, None meaning the image's own height)
+        '''
+        return '%s-%sx%s-%s' % (digest, target_width,
+                                'same' if target_height is None else target_height, energy_mode)
+
+    def path(self, name: str) -> str:
+        '''
+        Returns:
+        the path of entry name in the cache directory
+        '''
+        return os.path.join(self.cache_dir, name + '.npz')
+
+    def get(self, key: str):
+        '''
+        Returns:
+        the cached result for key (from memory, else from disk), or None
+        '''
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            return self.entries[key]
+        if self.cache_dir is not None and os.path.exists(self.path(key)):
+            with np.load(self.path(key)) as stored:
+                result = stored['array']
+            self.disk_hits += 1
+            self.remember(key, result)
+            return self.entries.get(key, result)
+        return None
+
+    def remember(self, key: str, result: np.ndarray):
+        '''
+        Keeps a (read only) result in memory, evicting the least recently
+        used ones to stay within memory_budget
+        '''
+        result.flags.writeable = False
+        if result.nbytes > self.memory_budget:
+            return
+        if key in self.entries:
+            self.memory_bytes -= self.entries.pop(key).nbytes
+        while self.entries and self.memory_bytes + result.nbytes > self.memory_budget:
+            ignored, evicted = self.entries.popitem(last=False)
+            self.memory_bytes -= evicted.nbytes
+            self.evictions += 1
+            self.stats.count('cache_evictions')
+        self.entries[key] = result
+        self.memory_bytes += result.nbytes
+
+    def store(self, name: str, array: np.ndarray):
+        '''
+        Writes array to the cache directory as name (atomically, so other
+        processes never read a partial file)
+        '''
+        handle, temporary = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        with os.fdopen(handle, 'wb') as file:
+            np.savez_compressed(file, array=array)
+        os.replace(temporary, self.path(name))
+
+    def importance_values(self, digest: str, image_array) -> np.ndarray:
+        '''
+        Returns:
+        the importance values of image_array, read from the cache directory if
+        they were stored there, else computed (and stored)
+        '''
+        from importance_calculator import energy_map
+        name = digest + '-energy'
+        if os.path.exists(self.path(name)):
+            with np.load(self.path(name)) as stored:
+                return stored['array']
+        with self.stats.stage('energy'):
+            values = energy_map(image_array)
+        self.store(name, values)
+        return values
+
+    def lookup(self, digest: str, load_image, target_width: int, target_height: int = None,
+               energy_mode: str = 'backward', workers: int = 1) -> np.ndarray:
+        '''
+        The cache in front of seamcarve.carve: returns the cached result for
+         the key, or carves the image returned by load_image() and caches that.
+
+        Returns:
+        the carved image, a read only array
+        '''
+        key = self.key(digest, target_width, target_height, energy_mode)
+        result = self.get(key)
+        if result is not None:
+            self.hits += 1
+            self.stats.count('cache_hits')
+            return result
+        self.misses += 1
+        self.stats.count('cache_misses')
+
+        from seamcarve import carve
+        image_array = load_image()
+        values = None
+        if self.cache_dir is not None and energy_mode == 'backward':
+            values = self.importance_values(digest, image_array)
+        carved_array, ignored = carve(image_array, target_width, workers=workers,
+                                      target_height=target_height, energy_mode=energy_mode,
+                                      stats=self.stats, importance_values=values)
+        #a compact copy: the carved view would keep the whole carving buffer alive
+        result = np.array(carved_array)
+        if self.cache_dir is not None:
+            self.store(key, result)
+        self.remember(key, result)
+        return result
+
+    def carve_array(self, image_array, target_width: int, target_height: int = None,
+                    energy_mode: str = 'backward', workers: int = 1) -> np.ndarray:
+        '''
+        Carves an image array like seamcarve.carve, through the cache
+
+        Returns:
+        the carved image, a read only array
+        '''
+        image_array = np.asarray(image_array)
+        return self.lookup(content_hash(image_array), lambda: image_array,
+                           target_width, target_height, energy_mode, workers)
+
+    def carve_file(self, path: str, target_width: int, target_height: int = None,
+                   energy_mode: str = 'backward', workers: int = 1) -> np.ndarray:
+        '''
+        Carves an image file like seamcarve.carve, through the cache. The key
+         comes from the file's bytes, so the image is only decoded on a miss.
+
+        Returns:
+        the carved image, a read only array
+        '''
+        with open(path, 'rb') as file:
+            data = file.read()
+
+        def load_image():
+            from PIL import Image
+            with self.stats.stage('decode'):
+                return np.array(Image.open(io.BytesIO(data)))
+        return self.lookup(content_hash(data), load_image, target_width, target_height,
+                           energy_mode, workers)
@@ -0,0 +1,120 @@
+'''
+In-place storage for an image that is being carved.
+
+Instead of building a mask and copying the whole image for every removed seam,
+the pixels live in one preallocated array; a seam is removed by shifting the
+rest of each row one column to the left (or, for a horizontal seam, the rest of
+each column one row up), and the current image is the view of the first
+(logical) height rows and width columns.
+'''
+import numpy as np
+
+
+def shift_out(seam, *arrays) -> list:
+    '''
+    Removes one element per row from each of the given arrays, in place
+
+    Parameters:
+    seam -- one column id per row (the element to remove)
+    arrays -- (height, width, ...) arrays (or views) sharing the seam's columns
+
+    Returns:
+    a list of views of the arrays, one column narrower
+    '''
+    for row, col in enumerate(np.asarray(seam).tolist()):
+        for array in arrays:
+            array[row, col:-1] = array[row, col + 1:]
+    return [array[:, :-1] for array in arrays]
+
+
+class CarvingBuffer:
+    '''
+    A copy of an image plus its logical height and width, carved in place.
+
+    Alongside the pixels, columns holds the original column id of every pixel, so
+    a seam removed from the carved image can be located on the source image (see
+    remove_seam) without any per-pixel work. Once a horizontal seam is removed,
+    rows likewise holds every pixel's original row id.
+    '''
+    def __init__(self, image_array):
+        self.pixels = np.array(image_array)
+        self.height, self.width = self.pixels.shape[0], self.pixels.shape[1]
+        self.columns = np.tile(np.arange(self.width, dtype=np.int32), (self.height, 1))
+        self.rows = None
+
+    def view(self) -> np.ndarray:
+        '''
+        Returns:
+        the current (carved) image, as a view into the buffer
+        '''
+        return self.pixels[:self.height, :self.width]
+
+    def column_view(self) -> np.ndarray:
+        '''
+        Returns:
+        the original column id of every pixel of the current image, as a view
+        '''
+        return self.columns[:self.height, :self.width]
+
+    def row_view(self) -> np.ndarray:
+        '''
+        Returns:
+        the original row id of every pixel of the current image, as a view
+        '''
+        if self.rows is None:
+            #no horizontal seam was removed yet, so every pixel is still on its row
+            return np.broadcast_to(np.arange(self.height, dtype=np.int32)[:, None],
+                                   (self.height, self.width))
+        return self.rows[:self.height, :self.width]
+
+    def original_coordinates(self, seam, horizontal: bool = False):
+        '''
+        Parameters:
+        seam -- a seam of the current image: one column id per row, or
+         one row id per column if horizontal
+
+        Returns:
+        a (rows, cols) tuple of the seam pixels' coordinates in the original image
+        '''
+        if horizontal:
+            index = (np.asarray(seam), np.arange(self.width))
+        else:
+            index = (np.arange(self.height), np.asarray(seam))
+        return self.row_view()[index], self.column_view()[index]
+
+    def remove_seam(self, seam) -> np.ndarray:
+        '''
+        Carves a (vertical) seam out of the current image
+
+        Parameters:
+        seam -- one column id (of the current image) per row
+
+        Returns:
+        the seam's column ids in the original image
+        '''
+        original = self.column_view()[np.arange(self.height), seam]
+        planes = [self.view(), self.column_view()]
+        if self.rows is not None:
+            planes.append(self.row_view())
+        shift_out(seam, *planes)
+        self.width -= 1
+        return original
+
+    def remove_horizontal_seam(self, seam) -> np.ndarray:
+        '''
+        Carves a horizontal seam out of the current image, by shifting the rest
+        of each column up (in place, through transposed views)
+
+        Parameters:
+        seam -- one row id (of the current image) per column
+
+        Returns:
+        the seam's row ids in the original image
+        '''
+        if self.rows is None:
+            self.rows = np.tile(np.arange(self.pixels.shape[0], dtype=np.int32)[:, None],
+                                (1, self.pixels.shape[1]))
+        original = self.row_view()[seam, np.arange(self.width)]
+        shift_out(seam, self.view().swapaxes(0, 1), self.column_view().T, self.row_view().T)
+        self.height -= 1
+        return original
@@ -7,12 +7,198 @@ of this based on the instructions from the handout and TODO comments below
 from os import remove
 
 
+def bit_parallel_scores(pattern: str, text: str):
+    '''
+    Myers' bit-vector algorithm, in Hyyrö's formulation for the distance
+     between whole strings: the edit distance between pattern and every
+     prefix of text, without a table.
+
+    One column of the table (for pattern) is kept as two bit vectors of +1
+     and -1 steps between consecutive cells, held in Python ints so any
+     length works, and the whole column is advanced one letter of text at a
+     time with a handful of integer operations. Exact for any lengths and
+     alphabets; O(m*n/w) time for machine word size w.
+
+    Yields:
+    the distance between pattern and text[:j], for j from 1 to len(text)
+    '''
+    length = len(pattern)
+    if length == 0:
+        yield from range(1, len(text) + 1)
+        return
+    matches = {}
+    for index, letter in enumerate(pattern):
+        matches[letter] = matches.get(letter, 0) | (1 << index)
+    mask = (1 << length) - 1
+    last = 1 << (length - 1)
+    plus, minus = mask, 0
+    score = length
+    for letter in text:
+        equal = matches.get(letter, 0)
+        vertical = equal | minus
+        horizontal = ((((equal & plus) + plus) & mask) ^ plus) | equal
+        plus_h = minus | (~(horizontal | plus) & mask)
+        minus_h = plus & horizontal
+        if plus_h & last:
+            score += 1
+        elif minus_h & last:
+            score -= 1
+        yield score
+        #the top row of the table steps by +1 per letter
+        plus_h = ((plus_h << 1) | 1) & mask
+        minus_h = (minus_h << 1) & mask
+        plus = minus_h | (~(vertical | plus_h) & mask)
+        minus = plus_h & vertical
+
+
+def bit_parallel_distance(start_word: str, end_word: str) -> int:
+    '''
+    The score of the similarity table (the edit distance between the words)
+     without building the table, see bit_parallel_scores (the shorter word
+     is the one held in bit vectors)
+    '''
+    if len(start_word) < len(end_word):
+        start_word, end_word = end_word, start_word
+    score = len(end_word)
+    for score in bit_parallel_scores(end_word, start_word):
+        pass
+    return score
+
+
+def banded_distance(start_word: str, end_word: str, max_distance: int):
+    '''
+    The edit distance between the words if it is at most max_distance,
+     with Ukkonen's banding: a path through the table that strays more than
+     max_distance cells from the diagonal already costs more than that, so
+     only the 2*max_distance+1 diagonals around it are filled, a row at a
+     time, and the fill stops as soon as a whole row is past max_distance.
+     O(max_distance * min(m, n)) time, O(max_distance) memory.
+
+    Returns:
+    the distance, or None if it is more than max_distance
+    '''
+    if len(start_word) > len(end_word):
+        start_word, end_word = end_word, start_word
+    if len(end_word) - len(start_word) > max_distance:
+        return None
+    band = 2 * max_distance + 1
+    #anything past max_distance is as good as infinite
+    over = max_distance + 1
+    length = len(end_word)
+    #row[d] is the cell of column d + row - max_distance (columns of end_word)
+    row = [over] * band
+    for column in range(min(length, max_distance) + 1):
+        row[column + max_distance] = column
+    for index, letter in enumerate(start_word, 1):
+        below = row
+        row = [over] * band
+        lo = max(0, max_distance - index)
+        hi = min(band, length - index + max_distance + 1)
+        for d in range(lo, hi):
+            column = d + index - max_distance
+            best = below[d + 1] + 1 if d + 1 < band else over
+            if column > 0:
+                best = min(best, row[d - 1] + 1,
+                           below[d] + (letter != end_word[column - 1]))
+            row[d] = min(best, over)
+        if min(row[lo:hi]) > max_distance:
+            return None
+    distance = row[length - len(start_word) + max_distance]
+    return distance if distance <= max_distance else None
+
+
+def last_row(start_word: str, end_word: str) -> list:
+    '''
+    Returns:
+    the edit distance between start_word and each prefix end_word[:j] of
+    end_word, for j from 0 to len(end_word)
+    '''
+    return [len(start_word)] + list(bit_parallel_scores(start_word, end_word))
+
+
+def hirschberg_script(start_word: str, end_word: str) -> list:
+    '''
+    An optimal edit script turning start_word into end_word, recovered with
+     Hirschberg's divide and conquer instead of a full table: the longer word
+     is split in half, the best place to split the shorter word is found from
+     the distances of the first half to the shorter word's prefixes and of
+     the second half to its suffixes (see last_row), and both halves are
+     solved the same way. Only rows over the shorter word are kept, so memory
+     is O(min(m, n)) (plus the bit vectors of last_row, O(max(m, n) / w)).
+
+    Returns:
+    a list of (operation, start_index, end_index) tuples, in order, where
+    operation is 'substitute' (start_word[start_index] by end_word[end_index]),
+    'delete' (start_word[start_index], end_index None) or 'insert'
+    (end_word[end_index], start_index None); its length is the edit distance
+    '''
+    swapped = len(start_word) < len(end_word)
+    if swapped:
+        start_word, end_word = end_word, start_word
+    script = []
+    #(start, end, start offset, end offset) pieces still to solve, in order
+    pending = [(start_word, end_word, 0, 0)]
+    while pending:
+        longer, shorter, longer_at, shorter_at = pending.pop()
+        if not shorter:
+            script.extend(('delete', longer_at + index, None) for index in range(len(longer)))
+        elif not longer:
+            script.extend(('insert', None, shorter_at + index) for index in range(len(shorter)))
+        elif len(longer) == 1 or len(shorter) == 1:
+            script.extend(single_letter_script(longer, shorter, longer_at, shorter_at))
+        else:
+            middle = len(longer) // 2
+            prefix = last_row(longer[:middle], shorter)
+            suffix = last_row(longer[middle:][::-1], shorter[::-1])
+            size = len(shorter)
+            split = min(range(size + 1), key=lambda j: prefix[j] + suffix[size - j])
+            #the second half goes on the stack first, so the first half is solved first
+            pending.append((longer[middle:], shorter[split:], longer_at + middle, shorter_at + split))
+            pending.append((longer[:middle], shorter[:split], longer_at, shorter_at))
+    if swapped:
+        flip = {'delete': 'insert', 'insert': 'delete', 'substitute': 'substitute'}
+        script = [(flip[operation], end_index, start_index)
+                  for operation, start_index, end_index in script]
+    return script
+
+
+def single_letter_script(start_word: str, end_word: str, start_at: int, end_at: int) -> list:
+    '''
+    The base case of hirschberg_script, where one of the words is a single
+     letter: keep it where it first appears in the other word (or substitute
+     it for the other word's first letter) and insert or delete the rest
+
+    Returns:
+    the edit script, with indices offset by start_at and end_at
+    '''
+    if len(start_word) == 1:
+        letter, others, insert = start_word, end_word, True
+    else:
+        letter, others, insert = end_word, start_word, False
+    kept = others.find(letter)
+    script = []
+    for index in range(len(others)):
+        if index == kept:
+            continue
+        if kept < 0 and index == 0:
+            script.append(('substitute', start_at, end_at))
+        elif insert:
+            script.append(('insert', None, end_at + index))
+        else:
+            script.append(('delete', start_at + index, None))
+    return script
+
+
 class CodeBreaker:
-    def __init__(self, start_word: str, end_word: str):
+    def __init__(self, start_word: str, end_word: str, similarity_table: bool = False):
         '''
         CodeBreaker constructor. Defines variables and initializes the similarity array
 
         You are responsible for initializing self.similarity_array in this method
+
+        The table takes O(m*n) memory, so it is only built when
+         similarity_array is first read (or right away with similarity_table
+         set); find_score and edit_script do not need it
         '''
         # A letter's case does not matter,
         #  we use lower() to make input words all lower-case
@@ -23,16 +209,55 @@ class CodeBreaker:
         #  and len(list(self.end_word)) > 0:
         #    self.trim_words()
 
-        self.similarity_array = self.fill_similarities()
+        # the similarity table, None until it is built
+        self.table = self.fill_similarities() if similarity_table else None
         
-    def find_score(self) -> int: 
+    def find_score(self, max_distance: int = None) -> int: 
         '''
         Since our table indexes by intersection of
          words to the point of the cell (vertically 
         or horizontally), and our result, we find our
          desired result at (0,0)
+
+        Without a table, the same score comes from bit_parallel_distance
+
+        max_distance -- only answer "within max_distance operations?": the
+         score if it is at most max_distance, else None (found with
+         banded_distance, which gives up early on dissimilar words)
+        '''
+        if self.table is not None:
+            score = self.table[0][0]
+        elif max_distance is not None:
+            return banded_distance(self.start_word, self.end_word, max_distance)
+        else:
+            score = bit_parallel_distance(self.start_word, self.end_word)
+        if max_distance is not None and score > max_distance:
+            return None
+        return score
+
+    @property
+    def similarity_array(self) -> list:
+        '''
+        The full similarity table (see fill_similarities), built on first use
+        '''
+        if self.table is None:
+            self.table = self.fill_similarities()
+        return self.table
+
+    @similarity_array.setter
+    def similarity_array(self, table: list):
+        self.table = table
+
+    def edit_script(self) -> list:
+        '''
+        One cheapest sequence of operations turning start_word into end_word,
+         found in linear memory without the table (see hirschberg_script)
+
+        Returns:
+        a list of ('substitute' | 'delete' | 'insert', start_index, end_index)
+        tuples, as many as find_score
         '''
-        return self.similarity_array[0][0]
+        return hirschberg_script(self.start_word, self.end_word)
 
 
     def fill_similarities(self):
@@ -66,8 +291,9 @@ class CodeBreaker:
          such iteration of a row, and is called iteratively for
           each row
         '''
-        start_word_lst = list(self.start_word)
-        end_word_lst = list(self.end_word)
+        #strings index just like lists, so there is nothing to convert per row
+        start_word_lst = self.start_word
+        end_word_lst = self.end_word
 
         for col in range(len(self.end_word)-1, -1, -1):
             #check if match at target cell
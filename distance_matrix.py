@@ -0,0 +1,139 @@
+'''
+All-pairs CodeBreaker scores for lists of words, on a process pool.
+
+distance_matrix fills an int32 matrix of scores (edit distances of the
+lower-cased words) block by block: the matrix is cut into square blocks that
+are handed to the worker processes, which write their results straight into
+the output, either a shared memory block or a np.memmap file that every worker
+opens by name (for matrices larger than memory). Scores of a list against
+itself are symmetric, so only the blocks on and above the diagonal are computed
+and each is mirrored below it.
+'''
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from codebreaker import bit_parallel_distance, banded_distance
+
+# words up to this long are scored with bit_parallel_distance even with a cap
+WORD_BITS = 64
+
+# the words and output matrix of the current worker process, see start_worker
+worker_state = {}
+
+
+def start_worker(row_words, column_words, shape, output: str, shared: bool, cap):
+    '''
+    Pool initializer: keeps the word lists and opens the output matrix once
+     per worker process, by the name of its shared memory block or the path
+     of its memmap file
+    '''
+    if shared:
+        from multiprocessing import shared_memory
+        #keep the block referenced, or the matrix buffer would be released
+        worker_state['memory'] = shared_memory.SharedMemory(name=output)
+        matrix = np.ndarray(shape, dtype=np.int32, buffer=worker_state['memory'].buf)
+    else:
+        matrix = np.memmap(output, dtype=np.int32, mode='r+', shape=shape)
+    worker_state.update(rows=row_words, columns=column_words, matrix=matrix, cap=cap)
+
+
+def score(start_word: str, end_word: str, cap) -> int:
+    '''
+    Returns:
+    the edit distance between the (lower-cased) words, or cap + 1 if it is
+    more than cap
+    '''
+    if cap is None:
+        return bit_parallel_distance(start_word, end_word)
+    if abs(len(start_word) - len(end_word)) > cap:
+        return cap + 1
+    if min(len(start_word), len(end_word)) <= WORD_BITS:
+        #the bit vectors fit in one machine word: faster than any band
+        distance = bit_parallel_distance(start_word, end_word)
+    else:
+        #the band gives up early on dissimilar pairs, the common case under a cap
+        distance = banded_distance(start_word, end_word, cap)
+    return cap + 1 if distance is None or distance > cap else distance
+
+
+def fill_block(top: int, bottom: int, left: int, right: int, mirror: bool):
+    '''
+    Worker task: scores rows top..bottom-1 against columns left..right-1 into
+     the output matrix. With mirror set the words are one list, the block is
+     at or above the diagonal and is copied to its transposed position (cells
+     below the diagonal of a diagonal block are not computed twice).
+    '''
+    rows, columns, cap = worker_state['rows'], worker_state['columns'], worker_state['cap']
+    block = np.zeros((bottom - top, right - left), dtype=np.int32)
+    for row in range(top, bottom):
+        start = left
+        if mirror:
+            #the pairs left of the diagonal are the mirrored ones
+            start = max(left, row + 1)
+        for column in range(start, right):
+            block[row - top, column - left] = score(rows[row], columns[column], cap)
+    matrix = worker_state['matrix']
+    if mirror and top == left:
+        block += np.triu(block, 1).T
+    matrix[top:bottom, left:right] = block
+    if mirror and top != left:
+        matrix[left:right, top:bottom] = block.T
+
+
+def distance_matrix(row_words, column_words=None, cap: int = None, processes: int = None,
+                    block_size: int = 256, output: str = None):
+    '''
+    Computes the CodeBreaker score of every pair of words
+     (row_words[i], column_words[j]) on a process pool
+
+    Parameters:
+    row_words, column_words -- lists of words; without column_words, every
+     pair of row_words is scored (each pair once, mirrored)
+    cap -- scores above cap are written as cap + 1; pairs whose lengths
+     differ by more than cap are not scored at all, and words longer than
+     WORD_BITS use the banded search, which gives up on them early (see
+     codebreaker.banded_distance)
+    processes -- pool size (defaults to the number of CPUs)
+    block_size -- rows and columns per task
+    output -- the path of a memmap file to write the matrix to (created or
+     overwritten); by default it is filled in shared memory and copied to an
+     ordinary array once done
+
+    Returns:
+    the (len(row_words), len(column_words)) int32 matrix, a np.memmap of the
+    output file if one was given
+    '''
+    rows = [word.lower() for word in row_words]
+    symmetric = column_words is None
+    columns = rows if symmetric else [word.lower() for word in column_words]
+    shape = (len(rows), len(columns))
+    memory = None
+    if output is None:
+        from multiprocessing import shared_memory
+        memory = shared_memory.SharedMemory(create=True, size=max(shape[0] * shape[1] * 4, 1))
+        matrix = np.ndarray(shape, dtype=np.int32, buffer=memory.buf)
+        target = memory.name
+    else:
+        matrix = np.memmap(output, dtype=np.int32, mode='w+', shape=shape)
+        target = output
+
+    try:
+        tasks = []
+        for top in range(0, shape[0], block_size):
+            for left in range(top if symmetric else 0, shape[1], block_size):
+                tasks.append((top, min(top + block_size, shape[0]),
+                              left, min(left + block_size, shape[1]), symmetric))
+        with ProcessPoolExecutor(processes or os.cpu_count(), initializer=start_worker,
+                                 initargs=(rows, columns, shape, target, memory is not None, cap)) as pool:
+            #result() re-raises anything that failed in a worker
+            for future in [pool.submit(fill_block, *task) for task in tasks]:
+                future.result()
+        if memory is None:
+            matrix.flush()
+            return matrix
+        return np.array(matrix)
+    finally:
+        if memory is not None:
+            del matrix
+            memory.close()
+            memory.unlink()
@@ -1,9 +1,74 @@
 '''
-DO NOT MODIFY THIS CLASS
-
 This is a helper class to calculate the importance values of the pixels in your image. This class is used 
 in the calculate_importance_values method in seamcarve.py
+
+calculate_importance_values is the original per-pixel implementation and is kept as the reference;
+calculate_importance_array computes the same values over the whole image at once with NumPy.
 '''
+import numpy as np
+from carving_buffer import shift_out
+
+
+def energy_map(image_array, workers: int = 1) -> np.ndarray:
+    '''
+    Vectorized importance values for a whole image
+
+    Parameters:
+    image_array -- a (height, width, channels) array with at least 3 (RGB) channels
+    workers -- with more than 1, the rows are split into that many strips computed
+     on a thread pool (see energy_strip); the values are the same either way
+
+    Returns:
+    a float64 (height, width) array where each value is the mean, over the pixel's 4-neighbors,
+    of the summed absolute RGB differences (same as ImportanceCalculator.get_importance_value)
+    '''
+    height = len(image_array)
+    if workers > 1 and height >= 2 * workers:
+        from concurrent.futures import ThreadPoolExecutor
+        values = np.empty((height, image_array.shape[1]))
+        bounds = np.linspace(0, height, workers + 1).astype(int)
+        def fill(top, bottom):
+            values[top:bottom] = energy_strip(image_array, top, bottom)
+        with ThreadPoolExecutor(workers) as pool:
+            list(pool.map(fill, bounds[:-1], bounds[1:]))
+        return values
+
+    # int16 holds every difference of two uint8 values, so nothing wraps around
+    rgb = np.asarray(image_array)[:, :, :3].astype(np.int16)
+    height, width = rgb.shape[0], rgb.shape[1]
+    totals = np.zeros((height, width), dtype=np.int32)
+    counts = np.zeros((height, width), dtype=np.int32)
+
+    #differences between each pixel and the one below it count for both pixels
+    vertical = np.abs(rgb[1:] - rgb[:-1]).sum(axis=2)
+    totals[1:] += vertical
+    totals[:-1] += vertical
+    counts[1:] += 1
+    counts[:-1] += 1
+
+    #likewise for each pixel and the one to its right
+    horizontal = np.abs(rgb[:, 1:] - rgb[:, :-1]).sum(axis=2)
+    totals[:, 1:] += horizontal
+    totals[:, :-1] += horizontal
+    counts[:, 1:] += 1
+    counts[:, :-1] += 1
+
+    # a 1x1 image has no neighbors at all; give it zero importance instead of dividing by zero
+    return totals / np.maximum(counts, 1)
+
+
+def energy_strip(image_array, top: int, bottom: int) -> np.ndarray:
+    '''
+    Importance values of rows top..bottom-1 only, computed from those rows plus
+    one halo row above and below (so the strip's edge rows see their real neighbors)
+
+    Returns:
+    a float64 (bottom - top, width) array, equal to energy_map(image_array)[top:bottom]
+    '''
+    halo_top = max(top - 1, 0)
+    strip = energy_map(image_array[halo_top:min(bottom + 1, len(image_array))])
+    return strip[top - halo_top:bottom - halo_top]
+
 
 class ImportanceCalculator:
     '''
@@ -54,6 +119,16 @@ class ImportanceCalculator:
             imp_vals.append(imp_row)
         return imp_vals
 
+    def calculate_importance_array(self) -> np.ndarray:
+        '''
+        Same values as calculate_importance_values, computed with NumPy over the whole image
+        instead of one pixel at a time
+
+        Returns:
+        a (height, width) float64 array of importance values
+        '''
+        return energy_map(self.image_array)
+
     def get_importance_value(self, row: int, col: int) -> int:
         '''
         A method to calculate the importance value of an index for "one pixel" (not the whole image)
@@ -80,3 +155,77 @@ class ImportanceCalculator:
                 importance_val += abs(neighbor_pixel_color[rgb] - curr_pixel_color[rgb])
 
         return importance_val / len(neighbors)
+
+
+def pixel_energies(image_array, rows, cols) -> np.ndarray:
+    '''
+    Importance values of selected pixels only
+
+    Parameters:
+    image_array -- a (height, width, channels) array with at least 3 (RGB) channels
+    rows, cols -- integer arrays (of the same shape) of the pixel coordinates
+
+    Returns:
+    a float64 array, shaped like rows, holding the same values energy_map would give at those pixels
+    '''
+    image_array = np.asarray(image_array)
+    height, width = image_array.shape[0], image_array.shape[1]
+    rows = np.asarray(rows)
+    cols = np.asarray(cols)
+    center = image_array[rows, cols, :3].astype(np.int16)
+    totals = np.zeros(rows.shape, dtype=np.int32)
+    counts = np.zeros(rows.shape, dtype=np.int32)
+    for d_row, d_col in ((-1, 0), (1, 0), (0, -1), (0, 1)):
+        n_rows = rows + d_row
+        n_cols = cols + d_col
+        valid = (n_rows >= 0) & (n_rows < height) & (n_cols >= 0) & (n_cols < width)
+        #clip so out of bounds neighbors can be read, then drop them with the mask
+        neighbor = image_array[np.clip(n_rows, 0, height - 1), np.clip(n_cols, 0, width - 1), :3]
+        totals += np.where(valid, np.abs(neighbor.astype(np.int16) - center).sum(axis=-1), 0)
+        counts += valid
+    return totals / np.maximum(counts, 1)
+
+
+class EnergyMap:
+    '''
+    Importance values of an image that is being carved one seam at a time.
+
+    Removing a seam only changes the neighbors of the pixels that were next to it,
+    so instead of recomputing the whole map after every removal, remove_seam drops
+    the seam from the map and recomputes just those pixels (a few per row).
+    '''
+    def __init__(self, img_array, values=None):
+        '''
+        values -- the image's importance values, if already computed (e.g. into a memmap);
+         they are then updated in place
+        '''
+        self.values = energy_map(img_array) if values is None else values
+        # (lo, hi) per row: the inclusive column range recomputed by the last remove_seam
+        self.changed = None
+
+    def remove_seam(self, carved_array, seam):
+        '''
+        Updates the map after a seam was carved out of the image
+
+        Parameters:
+        carved_array -- the image with the seam already removed
+        seam -- the removed seam, one column id per row (in the image before the removal)
+        '''
+        seam = np.asarray(seam)
+        height, width = self.values.shape
+        self.values, = shift_out(seam, self.values)
+
+        #a pixel's neighbors changed if it was next to the seam in its own row, or if the
+        #  seam passed on different sides of it in the rows above and below (which shifts
+        #  the pixel's vertical neighbors); that's the column range spanned by the seam
+        #  in this row and the rows next to it, plus one to the left
+        above = np.concatenate((seam[:1], seam[:-1]))
+        below = np.concatenate((seam[1:], seam[-1:]))
+        lo = np.maximum(np.minimum(np.minimum(above, below), seam) - 1, 0)
+        hi = np.minimum(np.maximum(np.maximum(above, below), seam), width - 2)
+        cols = lo[:, None] + np.arange(max(int((hi - lo).max()) + 1, 0))
+        rows = np.broadcast_to(np.arange(height)[:, None], cols.shape)
+        changed = cols <= hi[:, None]
+        rows, cols = rows[changed], cols[changed]
+        self.values[rows, cols] = pixel_energies(carved_array, rows, cols)
+        self.changed = (lo, hi)
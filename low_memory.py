@@ -0,0 +1,190 @@
+'''
+Bounded-memory carving for images larger than RAM.
+
+The pixels, importance values and dirs table live in np.memmap scratch files.
+Importance values are computed in strips of rows, and the seam DP is a
+streaming pass from the bottom strip up that only keeps one strip of costs in
+memory; dirs is written to its scratch file as it goes and read back strip by
+strip to trace the seam. The strip height is chosen so that the in-memory
+working set stays within a user-set budget.
+'''
+import tempfile
+import numpy as np
+from importance_calculator import EnergyMap, energy_strip
+from carving_buffer import shift_out
+from seam_dp import relax_row
+
+# rough in-memory bytes per pixel of a strip: the pixel copy, its int16 RGB, the
+# energy_map temporaries, and the float64 importance values and costs
+BYTES_PER_STRIP_PIXEL = 64
+
+
+def scratch_array(shape, dtype, scratch_dir: str = None) -> np.memmap:
+    '''
+    Returns:
+    a writable memmap backed by an anonymous temporary file in scratch_dir,
+    removed by the OS once the memmap is gone
+    '''
+    return np.memmap(tempfile.TemporaryFile(dir=scratch_dir), dtype=dtype, mode='w+', shape=shape)
+
+
+def strip_rows(width: int, memory_budget: int) -> int:
+    '''
+    Returns:
+    how many image rows fit in one strip under memory_budget (in bytes)
+    '''
+    return max(memory_budget // (width * BYTES_PER_STRIP_PIXEL), 1)
+
+
+def open_source(image, shape=None):
+    '''
+    Opens an image for reading a strip of rows at a time, without decoding it
+
+    Parameters:
+    image -- an array, the path of a .npy file, the path of a raw file of
+     uint8 pixels (row by row, channels last) if shape is given, or the path
+     of an image file PIL can read
+    shape -- the (height, width, channels) of a raw file
+
+    Returns:
+    a (shape, read_rows) tuple, read_rows(top, bottom) returning those rows
+    '''
+    if isinstance(image, str) and shape is not None:
+        source = np.memmap(image, dtype=np.uint8, mode='r', shape=tuple(shape))
+    elif isinstance(image, str) and image.endswith('.npy'):
+        source = np.load(image, mmap_mode='r')
+    elif isinstance(image, str):
+        from PIL import Image
+        source = Image.open(image)
+        channels = len(source.getbands())
+        shape = (source.height, source.width) + ((channels,) if channels > 1 else ())
+        #the first crop decodes the whole file (PIL keeps it for the next ones)
+        return shape, lambda top, bottom: np.asarray(source.crop((0, top, source.width, bottom)))
+    else:
+        source = image
+    return source.shape, lambda top, bottom: source[top:bottom]
+
+
+def load_pixels(image, memory_budget: int, scratch_dir: str = None, shape=None) -> np.memmap:
+    '''
+    Copies an image into a scratch memmap, a strip of rows at a time
+
+    Parameters:
+    image, shape -- see open_source; .npy and raw files are read through a
+     memmap, so they never have to fit in memory, while PIL decodes image
+     files in one go (and refuses those over Image.MAX_IMAGE_PIXELS * 2), so
+     those still have to fit once
+
+    Returns:
+    a (height, width, channels) uint8 memmap
+    '''
+    shape, read_rows = open_source(image, shape)
+    pixels = scratch_array(shape, np.uint8, scratch_dir)
+    step = strip_rows(shape[1], memory_budget)
+    for top in range(0, shape[0], step):
+        pixels[top:top + step] = read_rows(top, min(top + step, shape[0]))
+    return pixels
+
+
+def save_pixels(pixels, path: str, memory_budget: int) -> np.memmap:
+    '''
+    Writes pixels to a .npy file a strip of rows at a time, through a memmap
+     of the file, so the image is never copied in memory as a whole
+
+    Returns:
+    the memmap of the written file
+    '''
+    output = np.lib.format.open_memmap(path, mode='w+', dtype=pixels.dtype, shape=pixels.shape)
+    step = strip_rows(pixels.shape[1], memory_budget)
+    for top in range(0, pixels.shape[0], step):
+        output[top:top + step] = pixels[top:top + step]
+    output.flush()
+    return output
+
+
+def fill_energy(pixels, energy, step: int):
+    '''
+    Computes the importance values of pixels into energy, step rows at a time
+    (each strip is read with one extra row above and below so its edge rows
+    see their real neighbors)
+    '''
+    height = pixels.shape[0]
+    for top in range(0, height, step):
+        bottom = min(top + step, height)
+        energy[top:bottom] = energy_strip(pixels, top, bottom)
+
+
+def streaming_seam(energy, dirs, step: int) -> list:
+    '''
+    Finds the least important seam with the same DP as SeamCarve.fill_costs_dirs,
+     streamed over strips of step rows
+
+    Parameters:
+    energy -- (height, width) importance values (a memmap or array)
+    dirs -- (height - 1, width) int8 table, filled in place
+    step -- rows per strip
+
+    Returns:
+    the seam as a list of column ids
+    '''
+    height, width = energy.shape
+    costs = np.empty((step, width))
+    below = None
+    for bottom in range(height, 0, -step):
+        top = max(bottom - step, 0)
+        vals = np.asarray(energy[top:bottom], dtype=np.float64)
+        strip_dirs = np.zeros((bottom - top, width), dtype=np.int8)
+        for index in range(bottom - top - 1, -1, -1):
+            if below is None:
+                costs[index] = vals[index]
+            else:
+                relax_row(below, vals[index], costs[index], strip_dirs[index])
+            below = costs[index]
+        #the bottom image row has no dirs entry
+        dirs[top:min(bottom, height - 1)] = strip_dirs[:min(bottom, height - 1) - top]
+        below = costs[0].copy()
+
+    seam = [int(np.argmin(below))]
+    for top in range(0, height - 1, step):
+        strip_dirs = np.asarray(dirs[top:min(top + step, height - 1)])
+        for row_dirs in strip_dirs:
+            seam.append(seam[-1] + int(row_dirs[seam[-1]]))
+    return seam
+
+
+def carve_low_memory(image, seam_count: int, memory_budget: int = 256 * 2**20,
+                     scratch_dir: str = None, shape=None):
+    '''
+    Removes seam_count least important seams while keeping the in-memory working
+     set within memory_budget bytes
+
+    Everything the size of the image (pixels, importance values, dirs) stays in
+     scratch memmaps in scratch_dir (the system temp directory by default).
+     Seams are removed in place (see carving_buffer.shift_out) and the importance
+     values are updated incrementally with an EnergyMap; the DP is redone for
+     every seam as a streaming pass, so the seams match
+     SeamCarve.carve_seams(incremental=False).
+
+    Parameters:
+    image, shape -- an array or a file path, see open_source
+
+    Returns:
+    a (carved_array, seams) tuple, carved_array being a view of the pixels memmap
+    '''
+    pixels = load_pixels(image, memory_budget, scratch_dir, shape)
+    height, width = pixels.shape[0], pixels.shape[1]
+    if seam_count >= width:
+        raise ValueError("cannot carve %d seams from an image %d pixels wide" % (seam_count, width))
+    step = strip_rows(width, memory_budget)
+    values = scratch_array((height, width), np.float64, scratch_dir)
+    fill_energy(pixels, values, step)
+    energy = EnergyMap(pixels, values)
+    dirs = scratch_array((max(height - 1, 0), width), np.int8, scratch_dir)
+
+    seams = []
+    for ignored in range(seam_count):
+        seam = streaming_seam(energy.values, dirs[:, :pixels.shape[1]], step)
+        pixels, = shift_out(seam, pixels)
+        energy.remove_seam(pixels, seam)
+        seams.append(seam)
+    return pixels, seams
@@ -0,0 +1,205 @@
+'''
+Per-stage timers and counters for the carving pipeline.
+
+A CarveStats is handed to SeamCarve (SeamCarve(path, stats) or
+SeamCarve.from_array(image, stats)); the pipeline then times its stages
+(STAGES: decoding, importance values, DP, backtracking, seam removal and
+encoding) and counts its work per seam: cells relaxed by the DP, bytes of
+image-sized arrays allocated (the carving buffer, importance values and DP
+tables), reuse of the DP tables and cache lookups. Callbacks registered with
+on_seam get each seam's counters as it is removed.
+
+By default SeamCarve uses NULL_STATS, whose methods do nothing, so the
+instrumentation costs one no-op call per stage when it is not wanted.
+'''
+import functools
+import time
+from collections import defaultdict
+
+STAGES = ('decode', 'energy', 'dp', 'backtrack', 'removal', 'encode')
+
+
+class StageTimer:
+    '''
+    Context manager adding the time spent inside it to one stage of a
+    CarveStats. Nested stages are exclusive: while an inner stage runs, the
+    outer one is paused, so the stage times add up to the total.
+    '''
+    def __init__(self, stats, name: str):
+        self.stats = stats
+        self.name = name
+
+    def __enter__(self):
+        now = time.perf_counter()
+        running = self.stats.running
+        if running:
+            self.stats.seconds[running[-1][0]] += now - running[-1][1]
+        running.append([self.name, now])
+        self.stats.calls[self.name] += 1
+        return self
+
+    def __exit__(self, *exc_info):
+        now = time.perf_counter()
+        running = self.stats.running
+        name, start = running.pop()
+        self.stats.seconds[name] += now - start
+        if running:
+            running[-1][1] = now
+        return False
+
+
+class CarveStats:
+    '''
+    Timers per stage (seconds, calls) and counters (counters for the whole
+    run, seams for each removed seam's share of them).
+    '''
+    enabled = True
+
+    def __init__(self):
+        self.seconds = defaultdict(float)
+        self.calls = defaultdict(int)
+        self.counters = defaultdict(int)
+        self.seams = []
+        self.callbacks = []
+        self.running = []
+        self.last_seam = {}
+
+    def stage(self, name: str) -> StageTimer:
+        '''
+        Returns:
+        a context manager timing the code inside it as stage name
+        '''
+        return StageTimer(self, name)
+
+    def count(self, name: str, amount: int = 1):
+        '''
+        Adds amount to counter name
+        '''
+        self.counters[name] += amount
+
+    def on_seam(self, callback):
+        '''
+        Registers callback(record) to be called after each seam removal,
+        record being the dict seam_done adds to self.seams
+        '''
+        self.callbacks.append(callback)
+
+    def seam_done(self):
+        '''
+        Marks the end of one seam removal: its counters (their change since
+        the previous seam) are appended to self.seams and passed to the
+        callbacks
+        '''
+        record = {name: value - self.last_seam.get(name, 0)
+                  for name, value in self.counters.items()}
+        self.last_seam = dict(self.counters)
+        self.seams.append(record)
+        for callback in self.callbacks:
+            callback(record)
+
+    def hit_rate(self, name: str) -> float:
+        '''
+        Returns:
+        counters name + '_hits' over name + '_hits' plus name + '_misses'
+        (None if neither was counted)
+        '''
+        hits, misses = self.counters[name + '_hits'], self.counters[name + '_misses']
+        return hits / (hits + misses) if hits + misses else None
+
+    def summary(self) -> dict:
+        '''
+        Returns:
+        the timers and counters as plain dicts (e.g. to send between processes,
+        see merge)
+        '''
+        return {'seconds': dict(self.seconds), 'calls': dict(self.calls),
+                'counters': dict(self.counters), 'seams': len(self.seams)}
+
+    def merge(self, summary: dict):
+        '''
+        Adds the timers and counters of another run's summary to this one
+        '''
+        for name, value in summary['seconds'].items():
+            self.seconds[name] += value
+        for name, value in summary['calls'].items():
+            self.calls[name] += value
+        for name, value in summary['counters'].items():
+            self.counters[name] += value
+        self.seams.extend({} for ignored in range(summary['seams']))
+
+    def report(self) -> str:
+        '''
+        Returns:
+        a printable breakdown of the time per stage and the counters
+        '''
+        total = sum(self.seconds.values())
+        lines = ['%-10s %10s %7s %8s' % ('stage', 'seconds', 'share', 'calls')]
+        names = [name for name in STAGES if name in self.seconds]
+        names += sorted(name for name in self.seconds if name not in STAGES)
+        for name in names:
+            lines.append('%-10s %10.4f %6.1f%% %8d' % (
+                name, self.seconds[name], 100 * self.seconds[name] / total if total else 0.0,
+                self.calls[name]))
+        lines.append('%-10s %10.4f' % ('total', total))
+        seam_count = len(self.seams)
+        lines.append('seams: %d' % seam_count)
+        for name in sorted(self.counters):
+            if name.endswith(('_hits', '_misses')):
+                continue
+            per_seam = ' (%.1f per seam)' % (self.counters[name] / seam_count) if seam_count else ''
+            lines.append('%s: %d%s' % (name.replace('_', ' '), self.counters[name], per_seam))
+        rates = sorted({name.rsplit('_', 1)[0] for name in self.counters
+                        if name.endswith(('_hits', '_misses'))})
+        for name in rates:
+            lines.append('%s hit rate: %.1f%% (%d hits, %d misses)' % (
+                name.replace('_', ' '), 100 * self.hit_rate(name),
+                self.counters[name + '_hits'], self.counters[name + '_misses']))
+        return '\n'.join(lines)
+
+
+class NullTimer:
+    '''
+    A context manager that does nothing (NullStats.stage)
+    '''
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+class NullStats:
+    '''
+    The disabled CarveStats: every method does nothing
+    '''
+    enabled = False
+    timer = NullTimer()
+
+    def stage(self, name: str) -> NullTimer:
+        return self.timer
+
+    def count(self, name: str, amount: int = 1):
+        pass
+
+    def on_seam(self, callback):
+        pass
+
+    def seam_done(self):
+        pass
+
+
+NULL_STATS = NullStats()
+
+
+def stage_method(name: str):
+    '''
+    Decorator timing every call of a method as stage name of its
+    object's stats
+    '''
+    def decorate(method):
+        @functools.wraps(method)
+        def timed_method(self, *args, **kwargs):
+            with self.stats.stage(name):
+                return method(self, *args, **kwargs)
+        return timed_method
+    return decorate
@@ -0,0 +1,144 @@
+'''
+Coarse-to-fine seam search for very large images.
+
+The seam is first found on a downscaled copy of the image (halved once per
+pyramid level), then projected up one level at a time; at each finer level
+the dynamic programming only runs inside a band of columns around the
+projected seam, and importance values are only computed for the pixels in
+that band.
+'''
+import numpy as np
+from importance_calculator import energy_map, pixel_energies
+from carving_buffer import CarvingBuffer
+from seam_dp import relax_padded
+
+
+def downscale(image_array) -> np.ndarray:
+    '''
+    Halves an image in both dimensions by averaging 2x2 blocks of RGB values
+    (odd heights and widths repeat their last row/column)
+
+    Returns:
+    a (ceil(height/2), ceil(width/2), 3) uint8 array
+    '''
+    rgb = np.asarray(image_array)[:, :, :3]
+    height, width = rgb.shape[0], rgb.shape[1]
+    rgb = np.pad(rgb, ((0, height % 2), (0, width % 2), (0, 0)), mode='edge')
+    total = rgb[0::2, 0::2].astype(np.uint16)
+    total += rgb[1::2, 0::2]
+    total += rgb[0::2, 1::2]
+    total += rgb[1::2, 1::2]
+    total += 2
+    return (total // 4).astype(np.uint8)
+
+
+def banded_seam(image_array, centers, half_width: int):
+    '''
+    Finds the least important seam among those staying within half_width
+     columns of centers (one column id per row).
+
+    The DP is the same as SeamCarve.fill_costs_dirs (including leftmost
+     tiebreaks), run on a (height, 2*half_width+1) band whose offset follows
+     centers; a band as wide as the image gives the exact seam.
+
+    Parameters:
+    image_array -- the image (at least 3 channels)
+    centers -- the column each row's band is centered on
+    half_width -- band columns on each side of the center, at least 1
+     (enough to connect centers that move up to 2 columns per row)
+
+    Returns:
+    a (seam, cost) tuple, the seam as a list of column ids and cost
+     the summed importance along it
+    '''
+    height, width = image_array.shape[0], image_array.shape[1]
+    band = min(2 * max(half_width, 1) + 1, width)
+    lo = np.clip(np.asarray(centers) - band // 2, 0, width - band)
+    if band == width:
+        vals = energy_map(image_array)
+    else:
+        cols = lo[:, None] + np.arange(band)
+        vals = pixel_energies(image_array, np.broadcast_to(np.arange(height)[:, None], cols.shape), cols)
+    return band_seam(vals, lo)
+
+
+def band_seam(vals, lo):
+    '''
+    The DP of banded_seam, on importance values already gathered into a band
+     (each row relaxed with seam_dp.relax_padded, as in the full DP)
+
+    Parameters:
+    vals -- (height, band) importance values, row r holding the image's
+     columns lo[r] to lo[r] + band - 1
+    lo -- the first image column of each row's band
+
+    Returns:
+    a (seam, cost) tuple, as for banded_seam
+    '''
+    height, band = vals.shape
+    lo = np.asarray(lo)
+    costs = np.empty((height, band))
+    dirs = np.empty((height - 1, band), dtype=np.int8)
+    costs[-1] = vals[-1]
+    #the row below, padded with inf wide enough for any band offset change
+    pad = int(np.abs(np.diff(lo)).max(initial=0)) + 1
+    below = np.full(band + 2 * pad, np.inf)
+    for row in range(height - 2, -1, -1):
+        below[pad:pad + band] = costs[row + 1]
+        #column j of this row sits at column j + shift of the band below, so
+        #  its candidates start at below[start + j], as in a padded_row
+        start = pad + lo[row] - lo[row + 1] - 1
+        relax_padded(below[start:start + band + 2], vals[row], costs[row], dirs[row], 0, band)
+
+    j = int(np.argmin(costs[0]))
+    seam = [int(lo[0]) + j]
+    for row in range(height - 1):
+        seam.append(seam[-1] + int(dirs[row, j]))
+        j = seam[-1] - int(lo[row + 1])
+    return seam, float(vals[np.arange(height), np.array(seam) - lo].sum())
+
+
+def pyramid_seam(image_array, levels: int = 3, half_width: int = 4):
+    '''
+    Finds a low importance seam by searching a downscaled copy of the image
+     and refining the seam level by level
+
+    Parameters:
+    image_array -- the full resolution image
+    levels -- how many times the image is halved for the coarse search
+     (stops early once the image is a few pixels across)
+    half_width -- band half width used at every finer level
+
+    Returns:
+    a (seam, cost) tuple, as for banded_seam
+    '''
+    pyramid = [np.asarray(image_array)]
+    while len(pyramid) <= levels and min(pyramid[-1].shape[:2]) >= 8:
+        pyramid.append(downscale(pyramid[-1]))
+
+    coarsest = pyramid[-1]
+    width = coarsest.shape[1]
+    #a band as wide as the image: the exact seam at the coarsest level
+    seam, cost = banded_seam(coarsest, np.full(coarsest.shape[0], width // 2), width)
+    for image in reversed(pyramid[:-1]):
+        height, width = image.shape[0], image.shape[1]
+        #row r of this level lies under row r // 2 of the coarser one, column c under c // 2
+        centers = np.minimum(2 * np.asarray(seam)[np.arange(height) // 2], width - 1)
+        seam, cost = banded_seam(image, centers, half_width)
+    return seam, cost
+
+
+def carve_pyramid(image_array, seam_count: int, levels: int = 3, half_width: int = 4):
+    '''
+    Removes seam_count seams, each found with pyramid_seam
+
+    Returns:
+    a (carved_array, seams) tuple like SeamCarve.carve_seams
+    '''
+    buffer = CarvingBuffer(image_array)
+    seams = []
+    for ignored in range(seam_count):
+        seam, cost = pyramid_seam(buffer.view(), levels, half_width)
+        buffer.remove_seam(seam)
+        seams.append(seam)
+    return buffer.view(), seams
@@ -0,0 +1,75 @@
+'''
+Precomputed seam removal order, for resizing one image to many widths.
+
+Carving an image all the way down to one column removes every pixel but one,
+each at a known iteration. Recording that iteration per pixel (the "removal
+index") is enough to produce the carved image at any width w: it is made of
+the pixels removed at iteration W - w or later (or never), which is one
+vectorized gather with no dynamic programming.
+'''
+import numpy as np
+
+
+def compute_removal_index(seam_carve, seams_per_pass: int = 1) -> np.ndarray:
+    '''
+    Carves seam_carve's image down to a single column and records when every pixel goes
+
+    Parameters:
+    seam_carve -- a SeamCarve instance
+    seams_per_pass -- passed on to SeamCarve.carve_seams
+
+    Returns:
+    a (height, width) array holding, for each pixel, the iteration at which it is removed
+    (width - 1 for the pixel that is never removed); uint16 when that fits, else uint32
+    '''
+    width = seam_carve.image_width
+    dtype = np.uint16 if width <= np.iinfo(np.uint16).max + 1 else np.uint32
+    index = np.full((seam_carve.image_height, width), width - 1, dtype=dtype)
+    seam_carve.carve_seams(width - 1, seams_per_pass=seams_per_pass)
+    if seam_carve.original_seams:
+        rows = np.arange(seam_carve.image_height)
+        index[rows, np.array(seam_carve.original_seams)] = \
+            np.arange(width - 1, dtype=dtype)[:, None]
+    return index
+
+
+def retarget(image_array, removal_index, width: int) -> np.ndarray:
+    '''
+    Produces the carved image at the given width from a removal index
+
+    Parameters:
+    image_array -- the original image
+    removal_index -- the image's index from compute_removal_index
+    width -- the target width, from 1 up to the original width
+
+    Returns:
+    a new (height, width, ...) array
+    '''
+    height, full_width = removal_index.shape
+    if not 1 <= width <= full_width:
+        raise ValueError("target width must be between 1 and %d, got %d" % (full_width, width))
+    # every row keeps exactly the pixels removed at iteration full_width - width or later
+    keep = removal_index >= full_width - width
+    return image_array[keep].reshape((height, width) + image_array.shape[2:])
+
+
+def removal_index_path(image_path: str) -> str:
+    '''
+    Returns:
+    where the removal index of the image at image_path is stored (next to the image)
+    '''
+    return image_path + '.removal.npy'
+
+
+def save_removal_index(image_path: str, removal_index):
+    '''
+    Saves the removal index next to the image it belongs to
+    '''
+    np.save(removal_index_path(image_path), removal_index)
+
+
+def load_removal_index(image_path: str) -> np.ndarray:
+    '''
+    Loads the removal index saved next to the image at image_path
+    '''
+    return np.load(removal_index_path(image_path))
@@ -0,0 +1,229 @@
+'''
+Row-by-row dynamic programming for the seam costs and dirs tables.
+
+This is the core of SeamCarve.fill_costs_dirs, kept in its own module (with no
+image I/O) so it can be reused on its own and, for wide images, split across
+threads: every cell of a row only depends on the row below, so column chunks of
+a block of rows can be relaxed at the same time (see relax_block). fill_forward_rows is the same DP with
+forward energy costs.
+'''
+import numpy as np
+
+# the narrowest column chunk fill_rows hands to a thread: NumPy only releases
+#  the GIL inside its kernels, and a narrower chunk spends about as long in
+#  the Python around them (which the threads take turns on) as inside
+MIN_CHUNK_WIDTH = 1024
+
+# rows per fill_rows task; each adds a column of redundant halo work per row
+#  on each side of a chunk, but saves a wait for the other threads
+ROWS_PER_TASK = 32
+
+# spans of up to this many cells are relaxed one by one (see relax_cells)
+SMALL_SPAN = 8
+
+
+def padded_row(row, out=None) -> np.ndarray:
+    '''
+    Returns:
+    row with a +inf cell on each side (written into out if given, whose
+    first and last cells must already be +inf), as relax_padded takes it
+    '''
+    if out is None:
+        out = np.full(len(row) + 2, np.inf, dtype=row.dtype)
+    out[1:-1] = row
+    return out
+
+
+def relax_padded(padded, vals_row, costs_row, dirs_row, lo: int, hi: int):
+    '''
+    Fills columns lo..hi-1 of one row of the costs and dirs tables from the
+    row below it, given as a padded_row (padded[c + 1] is column c, and the
+    +inf cells stand for the candidates outside the image).
+
+    The three candidates are compared pairwise rather than stacked for an
+    argmin: a cell goes bottom-left if that is at most both others, else
+    bottom if that is at most bottom-right, which is the same leftmost
+    tiebreak as SeamCarve.argmin.
+    '''
+    left = padded[lo:hi]
+    center = padded[lo + 1:hi + 1]
+    right = padded[lo + 2:hi + 2]
+    best = np.minimum(center, right)
+    go_right = right < center
+    go_left = left <= best
+    np.minimum(left, best, out=best)
+    np.add(best, vals_row[lo:hi], out=costs_row[lo:hi])
+    dirs = dirs_row[lo:hi]
+    np.copyto(dirs, go_right, casting='unsafe')
+    dirs[go_left] = -1
+
+
+def relax_cells(below, vals_row, costs_row, dirs_row, lo: int, hi: int):
+    '''
+    relax_padded for a few cells, in plain Python floats: for a handful of
+    cells the fixed cost of each NumPy call is most of relax_padded's work.
+    The comparisons and the float64 additions are the same, so are the results.
+
+    Returns:
+    a (first, last) tuple of the columns whose cost changed, or None
+    '''
+    width = len(below)
+    start = max(lo - 1, 0)
+    candidates = below[start:min(hi + 1, width)].tolist()
+    values = vals_row[lo:hi].tolist()
+    old = costs_row[lo:hi].tolist()
+    new_costs, new_dirs = [], []
+    for column in range(lo, hi):
+        left = candidates[column - 1 - start] if column > 0 else float('inf')
+        center = candidates[column - start]
+        right = candidates[column + 1 - start] if column + 1 < width else float('inf')
+        if left <= center and left <= right:
+            best, step = left, -1
+        elif center <= right:
+            best, step = center, 0
+        else:
+            best, step = right, 1
+        new_costs.append(best + values[column - lo])
+        new_dirs.append(step)
+    costs_row[lo:hi] = new_costs
+    dirs_row[lo:hi] = new_dirs
+    changed = [index for index in range(hi - lo) if new_costs[index] != old[index]]
+    return (lo + changed[0], lo + changed[-1]) if changed else None
+
+
+def relax_row(below, vals_row, costs_row, dirs_row, lo: int = 0, hi: int = None):
+    '''
+    Fills columns lo..hi-1 of one row of the costs and dirs tables
+    from the (already filled) costs row below it.
+
+    Every cell picks the cheapest of the bottom-left, bottom and
+    bottom-right cells, ties going to the leftmost candidate exactly
+    like SeamCarve.argmin (see relax_padded). Candidates outside the
+    image are +inf and never picked.
+
+    Parameters:
+    below -- costs row under the one being filled
+    vals_row -- importance values of the row being filled
+    costs_row, dirs_row -- output rows, written in place
+    lo, hi -- the column range to fill (defaults to the whole row)
+    '''
+    if hi is None:
+        hi = len(below)
+    relax_padded(padded_row(below), vals_row, costs_row, dirs_row, lo, hi)
+
+
+def relax_block(vals, costs, dirs, top: int, bottom: int, lo: int, hi: int):
+    '''
+    Fills rows bottom-1 down to top of costs and dirs over columns lo..hi-1,
+     given the whole of row bottom, without reading anything another chunk
+     writes meanwhile: each row is first relaxed over a halo one column wider
+     on each side than the row above it needs (a trapezoid, bottom-1 being
+     the widest), in private rows, and only lo..hi-1 is copied to the tables.
+     The halo cells are computed again by the neighboring chunks, with the
+     same operands, so the tables are the same as from a single pass.
+    '''
+    width = costs.shape[1]
+    #padded rows of private costs: the one being filled and the one below it
+    current, below = np.full((2, width + 2), np.inf, dtype=costs.dtype)
+    local_dirs = np.empty(width, dtype=dirs.dtype)
+    halo = bottom - 1 - top
+    start, end = max(lo - halo - 1, 0), min(hi + halo + 1, width)
+    below[start + 1:end + 1] = costs[bottom, start:end]
+    for row in range(bottom - 1, top - 1, -1):
+        halo = row - top
+        start, end = max(lo - halo, 0), min(hi + halo, width)
+        relax_padded(below, vals[row], current[1:-1], local_dirs, start, end)
+        costs[row, lo:hi] = current[lo + 1:hi + 1]
+        dirs[row, lo:hi] = local_dirs[lo:hi]
+        current, below = below, current
+
+
+def fill_rows(vals, costs, dirs, workers: int = 1):
+    '''
+    Fills rows height-2 down to 0 of costs and dirs, given their bottom row
+
+    With more than one worker the columns are split into up to workers
+     chunks of at least MIN_CHUNK_WIDTH, and the rows into blocks of
+     ROWS_PER_TASK; every (block, chunk) is one task on a thread pool (see
+     relax_block; NumPy releases the GIL inside each chunk's kernels), so
+     the threads only wait for each other once per block, not once per row.
+     Every cell is computed exactly as in the single threaded pass, so the
+     tables are bit-identical. Images narrower than twice MIN_CHUNK_WIDTH
+     get one chunk, whatever workers is.
+
+    Parameters:
+    vals -- (height, width) importance values
+    costs -- (height, width) table, its bottom row already filled
+    dirs -- (height - 1, width) table
+    workers -- number of threads
+    '''
+    height, width = costs.shape
+    chunks = min(workers, max(width // MIN_CHUNK_WIDTH, 1))
+    if chunks <= 1:
+        #one padded copy of the row below, reused for every row
+        padded = np.full(width + 2, np.inf, dtype=costs.dtype)
+        for row in range(height - 2, -1, -1):
+            padded_row(costs[row + 1], padded)
+            relax_padded(padded, vals[row], costs[row], dirs[row], 0, width)
+        return
+
+    from concurrent.futures import ThreadPoolExecutor
+    bounds = np.linspace(0, width, chunks + 1).astype(int).tolist()
+    with ThreadPoolExecutor(chunks) as pool:
+        for bottom in range(height - 1, 0, -ROWS_PER_TASK):
+            top = max(bottom - ROWS_PER_TASK, 0)
+            #wait for the whole block before starting the one above it
+            list(pool.map(lambda lo, hi: relax_block(vals, costs, dirs, top, bottom, lo, hi),
+                          bounds[:-1], bounds[1:]))
+
+
+def neighbor_terms(rgb_row):
+    '''
+    Returns:
+    a (left, right, cost_up) tuple for one int16 RGB row: each pixel's left
+    and right neighbors (repeating the edge pixels) and the summed absolute
+    RGB difference between them, which is what removing the pixel puts side
+    by side
+    '''
+    left = np.concatenate((rgb_row[:1], rgb_row[:-1]))
+    right = np.concatenate((rgb_row[1:], rgb_row[-1:]))
+    return left, right, np.abs(right - left).sum(axis=1)
+
+
+def fill_forward_rows(image_array, costs, dirs):
+    '''
+    Fills costs and dirs with forward energy (Rubinstein, Shamir & Avidan
+     2008): the cost of a seam is the pixel difference it creates, not the
+     importance it removes. A cell's cost to reach the row below is the
+     difference between its left and right neighbors (which become adjacent),
+     plus, for a diagonal step, the difference between the pixel below it
+     and the neighbor it now sits next to.
+
+    Everything is computed from the pixels, two rows at a time, so no
+     importance values are ever materialized; the work per cell is constant,
+     as for fill_rows. Ties go to the leftmost candidate, as in relax_row.
+
+    Parameters:
+    image_array -- (height, width, channels) image, at least RGB
+    costs -- (height, width) float table, filled in place (bottom row included)
+    dirs -- (height - 1, width) int8 table, filled in place
+    '''
+    height, width = costs.shape
+    rgb = image_array[:, :, :3]
+    below = rgb[height - 1].astype(np.int16)
+    costs[-1] = neighbor_terms(below)[2]
+    candidates = np.empty((3, width), dtype=costs.dtype)
+    candidates[0, 0] = candidates[2, -1] = np.inf
+    for row in range(height - 2, -1, -1):
+        current = rgb[row].astype(np.int16)
+        left, right, cost_up = neighbor_terms(current)
+        #bottom-left: the pixel below ends up next to the left neighbor
+        cost_left = cost_up + np.abs(below - left).sum(axis=1)
+        cost_right = cost_up + np.abs(below - right).sum(axis=1)
+        np.add(costs[row + 1, :-1], cost_left[1:], out=candidates[0, 1:])
+        np.add(costs[row + 1], cost_up, out=candidates[1])
+        np.add(costs[row + 1, 1:], cost_right[:-1], out=candidates[2, :-1])
+        index = candidates.argmin(axis=0)
+        candidates.min(axis=0, out=costs[row])
+        np.subtract(index, 1, out=dirs[row], casting='unsafe')
+        below = current
@@ -1,7 +1,12 @@
+import os
 import pytest
 
 from codebreaker import *
 from seamcarve import *
+from removal_index import *
+from pyramid import *
+from low_memory import *
+from video import *
 
 
 '''
@@ -120,6 +125,102 @@ def test_0_len():
   assert cb.find_score() == 3
   assert cb.similarity_array == \
     [[3, 2, 1, 0]]
+def test_bit_parallel_score():
+  '''
+  the table-free score matches the table, for random words
+   of any length (longer than a machine word too) and alphabet
+  '''
+  import random
+  rng = random.Random(29)
+  for length in [0, 1, 5, 63, 64, 65, 200]:
+    for ignored in range(5):
+      start = ''.join(rng.choice('abcÉé') for ignored in range(rng.randint(0, length)))
+      end = ''.join(rng.choice('abcÉé') for ignored in range(rng.randint(0, length)))
+      cb = CodeBreaker(start, end)
+      assert bit_parallel_distance(cb.start_word, cb.end_word) == cb.find_score()
+      fast = CodeBreaker(start, end, similarity_table=False)
+      assert fast.find_score() == cb.find_score()
+  assert CodeBreaker('DoG', 'dog', similarity_table=False).find_score() == 0
+def test_max_distance():
+  '''
+  a banded search answers "within k?" exactly, with or
+   without the table
+  '''
+  import random
+  rng = random.Random(31)
+  for ignored in range(500):
+    start = ''.join(rng.choice('abc') for ignored in range(rng.randint(0, 12)))
+    end = ''.join(rng.choice('abc') for ignored in range(rng.randint(0, 12)))
+    score = CodeBreaker(start, end, similarity_table=True).find_score()
+    for max_distance in range(0, 8):
+      expected = score if score <= max_distance else None
+      assert banded_distance(start, end, max_distance) == expected
+      assert CodeBreaker(start, end).find_score(max_distance) == expected
+  assert CodeBreaker('slap', 'lap', similarity_table=True).find_score(max_distance=0) is None
+  assert CodeBreaker('x' * 5000, 'y' * 5000).find_score(max_distance=3) is None
+def test_word_index(tmp_path):
+  '''
+  the BK-tree gives exactly the brute force results, ties
+   in dictionary order, before and after a save and load
+  '''
+  from word_index import WordIndex
+  import random
+  rng = random.Random(32)
+  words = [''.join(rng.choice('abcdÉ') for ignored in range(rng.randint(0, 7)))
+           for ignored in range(400)] + ['Dog', 'dog', 'DOGS']
+  index = WordIndex.build(words)
+  index.save(str(tmp_path / 'words.npz'))
+  loaded = WordIndex.load(str(tmp_path / 'words.npz'))
+  assert loaded.words == words and len(loaded) == len(words)
+  for query in ['', 'dog', 'abcd', 'ééé', 'bacadab']:
+    brute = sorted((CodeBreaker(query, word).find_score(), position)
+                   for position, word in enumerate(words))
+    for max_distance in range(4):
+      expected = [(score, words[position]) for score, position in brute if score <= max_distance]
+      assert index.within(query, max_distance) == expected
+      assert loaded.within(query, max_distance) == expected
+    for count in [1, 3, 50, 500]:
+      expected = [(score, words[position]) for score, position in brute[:count]]
+      assert index.nearest(query, count) == expected
+      assert loaded.nearest(query, count) == expected
+  assert index.nearest('DOG', 2) == [(0, 'Dog'), (0, 'dog')]
+def apply_edit_script(start, end, script):
+  '''
+  start with the script's operations applied
+   (letters the script does not touch are kept)
+  '''
+  result, kept = [], 0
+  for operation, start_index, end_index in script:
+    if operation == 'insert':
+      #copy the untouched letters in front of the inserted one
+      copied = end_index - len(result)
+      result.extend(start[kept:kept + copied])
+      kept += copied
+    else:
+      result.extend(start[kept:start_index])
+      kept = start_index + 1
+    if operation != 'delete':
+      assert end_index == len(result)
+      result.append(end[end_index])
+  return ''.join(result) + start[kept:]
+def test_edit_script():
+  '''
+  the table is only built when asked for, and the
+   Hirschberg script is a cheapest way to the end word
+  '''
+  cb = CodeBreaker('slap', 'TRlap')
+  assert cb.find_score() == 2 and cb.table is None
+  assert cb.edit_script() == [('substitute', 0, 0), ('insert', None, 1)]
+  assert cb.table is None
+  assert cb.similarity_array[0][0] == 2 and cb.table is not None
+  import random
+  rng = random.Random(30)
+  for ignored in range(300):
+    start = ''.join(rng.choice('abc') for ignored in range(rng.randint(0, 30)))
+    end = ''.join(rng.choice('abc') for ignored in range(rng.randint(0, 30)))
+    script = CodeBreaker(start, end).edit_script()
+    assert len(script) == CodeBreaker(start, end, similarity_table=True).find_score()
+    assert apply_edit_script(start, end, script) == end
 
 
 '''
@@ -155,7 +256,7 @@ def test_5x5_example(): #5x5 sample functionality test on SeamCarve
     for j in range(0, 5):
         assert sc_spreadsheet.costs[i][j] == \
           pytest.approx(expected_costs[i][j])
-  assert sc_spreadsheet.dirs == expected_dirs
+  assert sc_spreadsheet.dirs.tolist() == expected_dirs
   assert computed_seam == expected_seam
 def test_5x5_tiebreaks():
   '''
@@ -188,7 +289,7 @@ def test_5x5_tiebreaks():
         assert sc_spreadsheet.costs[i][j]\
            == pytest.approx(expected_costs[i][j])
   
-  assert sc_spreadsheet.dirs == expected_dirs
+  assert sc_spreadsheet.dirs.tolist() == expected_dirs
   assert computed_seam == expected_seam
 def check_min_index_tiebreaking():
   '''
@@ -225,3 +326,703 @@ def check_min_index_smallest_on_start():
   lst = [0,3,2,1]
   sc_spreadsheet = SeamCarve("5x5_image.png")
   assert sc_spreadsheet.min_index(lst) == 0
+
+
+'''
+Vectorized importance values: these must match the original
+ per-pixel ImportanceCalculator exactly, including the edge and
+corner pixels that have fewer neighbors
+'''
+def test_importance_array_matches_reference():
+  '''
+  the sample 5x5 image, compared against the reference
+  '''
+  sc_spreadsheet = SeamCarve("5x5_image.png")
+  assert sc_spreadsheet.calculate_importance_array().tolist() == \
+    sc_spreadsheet.calculate_importance_values()
+def test_importance_array_random_shapes():
+  '''
+  random RGBA images, including single row
+   and single column images
+  '''
+  rng = np.random.default_rng(5)
+  for shape in [(7, 9, 4), (1, 6, 4), (6, 1, 4), (2, 2, 3)]:
+    image = rng.integers(0, 256, size=shape, dtype=np.uint8)
+    calc = ImportanceCalculator(image)
+    assert calc.calculate_importance_array().tolist() == \
+      calc.calculate_importance_values()
+
+
+def reference_costs_dirs(vals):
+  '''
+  cell-by-cell version of fill_costs_dirs, used to
+   check the vectorized tables (leftmost tiebreaks)
+  '''
+  height, width = len(vals), len(vals[0])
+  costs = [list(vals[-1]) for ignored in range(height)]
+  dirs = [[0] * width for ignored in range(height - 1)]
+  for row in range(height - 2, -1, -1):
+    for col in range(width):
+      best = None
+      for d in (-1, 0, 1):
+        if 0 <= col + d < width and \
+            (best is None or costs[row + 1][col + d] < best):
+          best = costs[row + 1][col + d]
+          dirs[row][col] = d
+      costs[row][col] = best + vals[row][col]
+  return costs, dirs
+def test_vectorized_dp_matches_reference():
+  '''
+  small integer values produce many ties, so this
+   also checks the leftmost tiebreaking on every row
+  '''
+  rng = np.random.default_rng(2)
+  sc_spreadsheet = SeamCarve("5x5_image.png")
+  for shape in [(9, 12), (6, 1), (1, 5), (20, 3)]:
+    vals = rng.integers(0, 4, size=shape).tolist()
+    costs, dirs = reference_costs_dirs(vals)
+    sc_spreadsheet.fill_costs_dirs(vals)
+    assert sc_spreadsheet.costs.tolist() == costs
+    assert sc_spreadsheet.dirs.tolist() == dirs
+    assert sc_spreadsheet.dirs.dtype == np.int8
+
+
+'''
+Incremental energy: after every removal the EnergyMap
+ must equal a full recompute on the carved image
+'''
+def test_energy_map_matches_full_recompute():
+  rng = np.random.default_rng(3)
+  image = rng.integers(0, 256, size=(15, 20, 4), dtype=np.uint8)
+  energy = EnergyMap(image)
+  sc_spreadsheet = SeamCarve("5x5_image.png")
+  for ignored in range(19):
+    seam = sc_spreadsheet.find_least_important_seam(energy.values)
+    image = remove_seam(image, seam)
+    energy.remove_seam(image, seam)
+    assert energy.values.tolist() == \
+      ImportanceCalculator(image).calculate_importance_array().tolist()
+def test_energy_map_disconnected_seam():
+  '''
+  seams that jump more than one column between rows
+  (not produced by the DP, but still valid to remove)
+  '''
+  rng = np.random.default_rng(4)
+  image = rng.integers(0, 256, size=(6, 8, 3), dtype=np.uint8)
+  energy = EnergyMap(image)
+  seam = [0, 7, 2, 2, 5, 1]
+  image = remove_seam(image, seam)
+  energy.remove_seam(image, seam)
+  assert energy.values.tolist() == \
+    ImportanceCalculator(image).calculate_importance_array().tolist()
+def test_carve_seams_5x5():
+  '''
+  carving keeps the height and removes one column per seam
+  '''
+  sc_spreadsheet = SeamCarve("5x5_image.png")
+  carved, seams = sc_spreadsheet.carve_seams(3)
+  assert carved.shape == (5, 2, 4)
+  assert len(seams) == 3
+  assert all(len(seam) == 5 for seam in seams)
+@pytest.mark.parametrize("small_span", [0, 8, 100])
+def test_incremental_dp_matches_full(monkeypatch, small_span):
+  '''
+  repaired costs/dirs tables (and so the seams) must equal
+   a from-scratch fill after every removal. Few distinct
+  colors make lots of ties to break. small_span picks the
+  vectorized relax, the one cell at a time one, or a mix
+  '''
+  import seamcarve
+  monkeypatch.setattr(seamcarve, "SMALL_SPAN", small_span)
+  rng = np.random.default_rng(6)
+  for colors in (256, 3):
+    image = rng.integers(0, colors, size=(18, 25, 3), dtype=np.uint8)
+    incremental = SeamCarve.from_array(image)
+    scratch = SeamCarve("5x5_image.png")
+    energy = EnergyMap(image)
+    seam = incremental.find_least_important_seam(energy.values)
+    for ignored in range(20):
+      image = remove_seam(image, seam)
+      energy.remove_seam(image, seam)
+      incremental.repair_costs_dirs(energy.values, seam, *energy.changed)
+      seam = scratch.find_least_important_seam(energy.values)
+      assert incremental.costs.tolist() == scratch.costs.tolist()
+      assert incremental.dirs.tolist() == scratch.dirs.tolist()
+    full, full_seams = incremental.carve_seams(20, incremental=False)
+    repaired, repaired_seams = incremental.carve_seams(20, incremental=True)
+    assert full_seams == repaired_seams
+    assert (full == repaired).all()
+
+
+'''
+Batched carving: several disjoint seams from a
+ single fill of the tables
+'''
+@pytest.mark.parametrize("small_batch", [0, 100])
+def test_disjoint_seams(monkeypatch, small_batch):
+  '''
+  small_batch picks the vectorized or the one seam at a
+   time packing of colliding seams, which must agree
+  '''
+  import seamcarve
+  monkeypatch.setattr(seamcarve, "SMALL_BATCH", small_batch)
+  rng = np.random.default_rng(8)
+  vals = rng.integers(0, 5, size=(12, 16)).astype(float)
+  sc_spreadsheet = SeamCarve("5x5_image.png")
+  seams = sc_spreadsheet.find_disjoint_seams(vals, 6)
+  assert seams[0] == sc_spreadsheet.find_least_important_seam(vals)
+  assert len(seams) == 6
+  for row in range(12):
+    assert len(set(seam[row] for seam in seams)) == 6
+  for seam in seams:
+    assert all(abs(a - b) <= 1 for a, b in zip(seam, seam[1:]))
+  #seams never run out of pixels: on flat values every start gives one
+  flat = sc_spreadsheet.find_disjoint_seams(np.zeros((12, 16)), 16)
+  assert sorted(seam[0] for seam in flat) == list(range(16))
+  for row in range(12):
+    assert len(set(seam[row] for seam in flat)) == 16
+  #nor does pushing seams aside, even with one per column
+  for count in (9, 15, 16):
+    vals = rng.integers(0, 5, size=(30, 16)).astype(float)
+    seams = np.array(sc_spreadsheet.find_disjoint_seams(vals, count))
+    assert seams[0].tolist() == sc_spreadsheet.find_least_important_seam(vals)
+    assert (np.abs(np.diff(seams, axis=1)) <= 1).all()
+    assert all(len(set(column)) == count for column in seams.T.tolist())
+    monkeypatch.setattr(seamcarve, "SMALL_BATCH", 100 - small_batch)
+    assert sc_spreadsheet.find_disjoint_seams(vals, count) == seams.tolist()
+    monkeypatch.setattr(seamcarve, "SMALL_BATCH", small_batch)
+def test_batched_carving():
+  '''
+  removing a batch one seam at a time (with shifted
+   column ids) equals dropping all of its pixels at once
+  '''
+  rng = np.random.default_rng(9)
+  image = rng.integers(0, 256, size=(10, 14, 3), dtype=np.uint8)
+  sc_spreadsheet = SeamCarve.from_array(image)
+  batch = sc_spreadsheet.find_disjoint_seams(
+    ImportanceCalculator(image).calculate_importance_array(), 4)
+  carved, seams = sc_spreadsheet.carve_seams(4, seams_per_pass=4)
+  keep = np.ones((10, 14), dtype=bool)
+  for seam in batch:
+    keep[np.arange(10), seam] = False
+  assert (carved == image[keep].reshape(10, 10, 3)).all()
+
+  comparison = sc_spreadsheet.compare_batched_carving(8, 4)
+  assert comparison['difference'] == \
+    pytest.approx(comparison['batched'] - comparison['sequential'])
+  assert sc_spreadsheet.compare_batched_carving(8, 1)['difference'] == 0
+
+
+'''
+In-place carving buffer
+'''
+def test_carving_buffer():
+  rng = np.random.default_rng(10)
+  image = rng.integers(0, 256, size=(7, 9, 4), dtype=np.uint8)
+  buffer = CarvingBuffer(image)
+  expected = image
+  seams = [[3, 4, 4, 5, 6, 7, 8], [0, 0, 1, 0, 1, 2, 1], [6, 5, 4, 3, 2, 1, 0]]
+  for seam in seams:
+    buffer.remove_seam(seam)
+    expected = remove_seam(expected, seam)
+    assert (buffer.view() == expected).all()
+    assert np.shares_memory(buffer.view(), buffer.pixels)
+    #every remaining pixel still matches its original column
+    assert (image[np.arange(7)[:, None], buffer.column_view()] == expected).all()
+def test_original_seams_overlay():
+  '''
+  seams removed by carve_seams, mapped back to the
+   source, cover exactly the pixels that were carved out
+  '''
+  sc_spreadsheet = SeamCarve("5x5_image.png")
+  carved, seams = sc_spreadsheet.carve_seams(2)
+  kept = np.ones((5, 5), dtype=bool)
+  kept[np.arange(5), np.array(sc_spreadsheet.original_seams)] = False
+  assert (carved == sc_spreadsheet.image_array[kept].reshape(5, 3, 4)).all()
+  overlay = sc_spreadsheet.image_array.copy()
+  draw_seams(overlay, sc_spreadsheet.original_seams)
+  assert (overlay[kept] == sc_spreadsheet.image_array[kept]).all()
+  assert (overlay[~kept, :3] == 200).all()
+
+
+'''
+Precomputed removal index: any width from a single gather
+'''
+def test_removal_index_matches_carving(tmp_path):
+  rng = np.random.default_rng(11)
+  image = rng.integers(0, 256, size=(6, 9, 3), dtype=np.uint8)
+  sc_spreadsheet = SeamCarve.from_array(image)
+  index = compute_removal_index(sc_spreadsheet)
+  assert index.dtype == np.uint16
+  #every row removes each iteration exactly once
+  assert (np.sort(index, axis=1) == np.arange(9)).all()
+  for width in range(1, 10):
+    carved, ignored = sc_spreadsheet.carve_seams(9 - width)
+    assert (retarget(image, index, width) == carved).all()
+
+  path = str(tmp_path / "image.png")
+  save_removal_index(path, index)
+  assert (load_removal_index(path) == index).all()
+
+
+'''
+Coarse-to-fine (pyramid) seam search
+'''
+def test_banded_seam_full_band_is_exact():
+  rng = np.random.default_rng(12)
+  image = rng.integers(0, 4, size=(20, 17, 3), dtype=np.uint8)
+  vals = ImportanceCalculator(image).calculate_importance_array()
+  seam, cost = banded_seam(image, np.zeros(20, dtype=int), 17)
+  assert seam == SeamCarve("5x5_image.png").find_least_important_seam(vals)
+  assert cost == pytest.approx(vals[np.arange(20), seam].sum())
+def test_pyramid_seam():
+  '''
+  pyramid seams are connected, in bounds, and with no
+   coarser levels the search is exact
+  '''
+  rng = np.random.default_rng(13)
+  image = rng.integers(0, 256, size=(45, 61, 3), dtype=np.uint8)
+  assert downscale(image).shape == (23, 31, 3)
+  exact = banded_seam(image, np.zeros(45, dtype=int), 61)
+  assert pyramid_seam(image, levels=0) == exact
+  seam, cost = pyramid_seam(image, levels=2, half_width=2)
+  assert len(seam) == 45 and all(0 <= col < 61 for col in seam)
+  assert all(abs(a - b) <= 1 for a, b in zip(seam, seam[1:]))
+  assert cost >= exact[1]
+  carved, seams = carve_pyramid(image, 5, levels=2, half_width=2)
+  assert carved.shape == (45, 56, 3) and len(seams) == 5
+
+
+'''
+Bounded-memory (memmap) carving
+'''
+def test_low_memory_matches_in_memory(tmp_path):
+  '''
+  a tiny budget forces strips of a couple of rows, which
+   must not change the importance values or the seams
+  '''
+  rng = np.random.default_rng(14)
+  image = rng.integers(0, 256, size=(11, 13, 3), dtype=np.uint8)
+  budget = 2 * 13 * BYTES_PER_STRIP_PIXEL
+  assert strip_rows(13, budget) == 2
+  energy = scratch_array((11, 13), np.float64, str(tmp_path))
+  fill_energy(image, energy, 2)
+  assert energy.tolist() == \
+    ImportanceCalculator(image).calculate_importance_array().tolist()
+
+  sc_spreadsheet = SeamCarve.from_array(image)
+  expected, expected_seams = sc_spreadsheet.carve_seams(6, incremental=False)
+  np.save(str(tmp_path / "image.npy"), image)
+  image.tofile(str(tmp_path / "image.raw"))
+  sources = [(image, None), (str(tmp_path / "image.npy"), None),
+             (str(tmp_path / "image.raw"), image.shape)]
+  for source, shape in sources:
+    carved, seams = carve_low_memory(source, 6, budget, str(tmp_path), shape)
+    assert isinstance(carved, np.memmap)
+    assert seams == expected_seams
+    assert (carved == expected).all()
+  #written strip by strip, but a plain .npy file
+  save_pixels(carved, str(tmp_path / "carved.npy"), budget)
+  assert (np.load(str(tmp_path / "carved.npy")) == expected).all()
+
+
+'''
+Multi-threaded importance values and DP must be
+ bit-identical to the single threaded ones
+'''
+def test_parallel_matches_single_thread(monkeypatch):
+  import seam_dp
+  monkeypatch.setattr(seam_dp, "MIN_CHUNK_WIDTH", 4)
+  #blocks of a few rows, the last one shorter, with halos wider than a chunk
+  monkeypatch.setattr(seam_dp, "ROWS_PER_TASK", 6)
+  rng = np.random.default_rng(15)
+  image = rng.integers(0, 4, size=(23, 37, 3), dtype=np.uint8)
+  single = SeamCarve.from_array(image)
+  threaded = SeamCarve.from_array(image)
+  threaded.workers = 4
+  vals = single.calculate_importance_array()
+  assert (threaded.calculate_importance_array() == vals).all()
+  single.fill_costs_dirs(vals)
+  threaded.fill_costs_dirs(vals)
+  assert (threaded.costs == single.costs).all()
+  assert (threaded.dirs == single.dirs).all()
+  assert threaded.carve_seams(5)[1] == single.carve_seams(5)[1]
+
+
+'''
+Library entry point
+'''
+def test_carve_library_api():
+  rng = np.random.default_rng(16)
+  image = rng.integers(0, 256, size=(12, 15, 3), dtype=np.uint8)
+  carved, seams = carve(image, 10)
+  expected, expected_seams = SeamCarve.from_array(image).carve_seams(5)
+  assert carved.shape == (12, 10, 3) and seams == expected_seams
+  assert (carved == expected).all()
+  assert carve(image, 15)[0].shape == (12, 15, 3)
+  with pytest.raises(ValueError):
+    carve(image, 0)
+def test_import_has_no_side_effects():
+  '''
+  importing the module in a fresh interpreter must not
+   parse argv or load PIL/argparse
+  '''
+  import os, subprocess, sys
+  code = "import sys, seamcarve; print(sorted(m for m in " + \
+    "('PIL', 'argparse') if m in sys.modules))"
+  output = subprocess.run([sys.executable, "-c", code, "--bogus"],
+    capture_output=True, text=True, check=True,
+    cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+  assert output.strip() == "[]"
+
+
+'''
+Batch carving of image files
+'''
+def test_batch_carving(tmp_path):
+  import shutil
+  from PIL import Image
+  from batch_carve import collect_images, carve_files
+  shutil.copy("5x5_image.png", str(tmp_path / "a.png"))
+  Image.fromarray(np.zeros((4, 9, 3), dtype=np.uint8)).save(str(tmp_path / "b.png"))
+  (tmp_path / "broken.png").write_text("not an image")
+  (tmp_path / "notes.txt").write_text("skipped")
+  paths = collect_images(str(tmp_path))
+  assert [os.path.basename(path) for path in paths] == \
+    ["a.png", "b.png", "broken.png"]
+  assert collect_images(str(tmp_path / "*.txt")) == [str(tmp_path / "notes.txt")]
+
+  results = {os.path.basename(result['path']): result for result in
+    carve_files(paths, str(tmp_path / "out"), target_width=3, processes=2)}
+  assert 'error' in results["broken.png"]
+  assert results["a.png"]['shape'] == (5, 3, 4)
+  assert np.array(Image.open(results["b.png"]['output'])).shape == (4, 3, 3)
+
+  #same-named images from different directories get different outputs
+  for directory in ("x", "y"):
+    (tmp_path / "nested" / directory).mkdir(parents=True)
+    shutil.copy(str(tmp_path / "b.png"), str(tmp_path / "nested" / directory / "b.png"))
+  paths = collect_images(str(tmp_path / "nested" / "*" / "*.png"))
+  outputs = sorted(result['output'] for result in
+    carve_files(paths, str(tmp_path / "out2"), target_width=3, processes=2))
+  assert outputs == [str(tmp_path / "out2" / directory / "b.png") for directory in ("x", "y")]
+  assert all(os.path.exists(output) for output in outputs)
+
+
+'''
+Streaming carve: one yield per removed seam
+'''
+def test_iter_carve():
+  import itertools
+  rng = np.random.default_rng(17)
+  image = rng.integers(0, 256, size=(9, 12, 3), dtype=np.uint8)
+  expected, expected_seams = SeamCarve.from_array(image).carve_seams(11)
+  sc_spreadsheet = SeamCarve.from_array(image)
+  widths = []
+  for (seam, view), expected_seam in \
+      zip(sc_spreadsheet.iter_carve(), expected_seams):
+    assert seam == expected_seam
+    assert np.shares_memory(view, sc_spreadsheet.buffer.pixels)
+    widths.append(view.shape[1])
+  assert widths == list(range(11, 0, -1))
+  assert (view == expected).all()
+
+  #stopping early leaves the remaining seams uncomputed
+  sc_spreadsheet = SeamCarve.from_array(image)
+  taken = list(itertools.islice(sc_spreadsheet.iter_carve(), 2))
+  assert len(taken) == 2 and sc_spreadsheet.buffer.width == 10
+  assert len(sc_spreadsheet.seam_costs) == 2
+
+
+'''
+Seam insertion (enlarging)
+'''
+def test_insert_seams():
+  rng = np.random.default_rng(18)
+  image = rng.integers(0, 256, size=(8, 10, 3), dtype=np.uint8)
+  sc_spreadsheet = SeamCarve.from_array(image)
+  enlarged, seams = sc_spreadsheet.insert_seams(4)
+  assert enlarged.shape == (8, 14, 3) and seams.shape == (4, 8)
+  vals = ImportanceCalculator(image).calculate_importance_array()
+  #the first pass plans a quarter of the 10 columns
+  assert seams[:2].tolist() == sc_spreadsheet.find_disjoint_seams(vals, 2)
+  for row in range(8):
+    out = []
+    for col in range(10):
+      out.append(image[row, col].tolist())
+      if col in seams[:, row]:
+        right = image[row, min(col + 1, 9)].astype(int)
+        out.append(((image[row, col] + right + 1) // 2).tolist())
+    assert enlarged[row].tolist() == out
+def test_plan_seams_needs_several_passes():
+  '''
+  asking for almost as many seams as there are columns
+   still gives disjoint seams covering distinct pixels
+  '''
+  rng = np.random.default_rng(19)
+  image = rng.integers(0, 256, size=(12, 6, 3), dtype=np.uint8)
+  seams = SeamCarve.from_array(image).plan_seams(5)
+  for row in range(12):
+    assert len(set(seams[:, row].tolist())) == 5
+  enlarged, ignored = carve(image, 11)
+  assert enlarged.shape == (12, 11, 3)
+def test_inserted_seams_avoid_important_region():
+  '''
+  the planned seams are the cheapest ones: with a busy
+   stripe in an otherwise flat image, none goes through it
+  '''
+  rng = np.random.default_rng(20)
+  image = np.full((16, 40, 3), 90, dtype=np.uint8)
+  image[:, 12:24] = rng.integers(0, 256, size=(16, 12, 3))
+  sc_spreadsheet = SeamCarve.from_array(image)
+  enlarged, seams = sc_spreadsheet.insert_seams(20)
+  assert enlarged.shape == (16, 60, 3)
+  assert not ((seams >= 11) & (seams <= 24)).any()
+
+
+'''
+Horizontal seams and 2D retargeting
+'''
+def test_horizontal_seams_match_transposed_image():
+  '''
+  a horizontal seam is the vertical seam of the transposed image,
+   found and removed without copying
+  '''
+  rng = np.random.default_rng(21)
+  image = rng.integers(0, 256, size=(9, 12, 3), dtype=np.uint8)
+  transposed, ignored = carve(image.transpose(1, 0, 2), 6)
+  sc_spreadsheet = SeamCarve.from_array(image)
+  carved_array, removals = sc_spreadsheet.retarget(6, 12)
+  assert [kind for kind, seam in removals] == ['horizontal'] * 3
+  assert (carved_array == transposed.transpose(1, 0, 2)).all()
+  assert np.shares_memory(carved_array, sc_spreadsheet.buffer.pixels)
+def test_retarget_2d():
+  '''
+  mixed removals give the same image as recomputing everything after
+   each removal, and remove every original pixel at most once
+  '''
+  rng = np.random.default_rng(22)
+  image = rng.integers(0, 256, size=(14, 16, 3), dtype=np.uint8)
+  sc_spreadsheet = SeamCarve.from_array(image)
+  carved_array, removals = sc_spreadsheet.retarget(10, 11)
+  assert carved_array.shape == (10, 11, 3)
+  assert {kind for kind, seam in removals} == {'vertical', 'horizontal'}
+
+  current = image
+  for kind, seam in removals:
+    vals = energy_map(current)
+    if kind == 'vertical':
+      assert sc_spreadsheet.find_least_important_seam(vals) == seam
+      current = remove_seam(current, seam)
+    else:
+      assert sc_spreadsheet.find_horizontal_seam(vals) == seam
+      current = remove_seam(current.transpose(1, 0, 2), seam).transpose(1, 0, 2)
+  assert (current == carved_array).all()
+
+  removed = np.zeros((14, 16), dtype=int)
+  for rows, cols in sc_spreadsheet.removed_pixels:
+    removed[rows, cols] += 1
+  assert removed.max() == 1 and removed.sum() == 14 * 16 - 10 * 11
+  assert (carve(image, 11, target_height=10)[0] == carved_array).all()
+
+
+'''
+Video carving
+'''
+def test_video_full_dp_matches_cold_carving():
+  '''
+  with exact energy updates and the band never trusted,
+   every frame is carved like a cold SeamCarve would
+  '''
+  rng = np.random.default_rng(23)
+  frames = rng.integers(0, 256, size=(4, 10, 14, 3), dtype=np.uint8)
+  frames[2] = frames[1]
+  frames[3, 2:5, 3:6] = 255
+  carver = VideoCarver(9, degrade_ratio=0, threshold=0)
+  for frame in frames:
+    carved_array, seams = carver.carve_frame(frame)
+    expected, expected_seams = carve(frame, 9)
+    assert (carved_array == expected).all() and seams == expected_seams
+    assert (carver.values == energy_map(frame)).all()
+  assert carver.reused_frames == 1
+def test_video_band_search():
+  '''
+  a small change keeps the next frame's seams in the
+   band around the previous ones
+  '''
+  rng = np.random.default_rng(24)
+  frame = rng.integers(0, 256, size=(12, 20, 3), dtype=np.uint8)
+  moved = frame.copy()
+  moved[4:6, 8:10] = 0
+  results = list(carve_video([frame, moved], 16, half_width=2, degrade_ratio=10))
+  carver_seams = [seams for ignored, seams in results]
+  for before, after in zip(*carver_seams):
+    assert max(abs(a - b) for a, b in zip(before, after)) <= 2
+  assert results[1][0].shape == (12, 16, 3)
+
+
+'''
+Forward energy
+'''
+def forward_energy_reference(image):
+  '''
+  forward energy DP written out cell by cell
+   (bottom up, leftmost tiebreaks)
+  '''
+  rgb = image[:, :, :3].astype(int)
+  height, width = rgb.shape[0], rgb.shape[1]
+  diff = lambda a, b: int(np.abs(a - b).sum())
+  pixel = lambda row, col: rgb[row, min(max(col, 0), width - 1)]
+  cost_up = lambda row, col: diff(pixel(row, col + 1), pixel(row, col - 1))
+  costs = [[0] * width for row in range(height)]
+  dirs = [[0] * width for row in range(height - 1)]
+  for col in range(width):
+    costs[-1][col] = cost_up(height - 1, col)
+  for row in range(height - 2, -1, -1):
+    for col in range(width):
+      options = []
+      if col > 0:
+        options.append((costs[row + 1][col - 1] + cost_up(row, col)
+                        + diff(rgb[row + 1, col], pixel(row, col - 1)), -1))
+      options.append((costs[row + 1][col] + cost_up(row, col), 0))
+      if col < width - 1:
+        options.append((costs[row + 1][col + 1] + cost_up(row, col)
+                        + diff(rgb[row + 1, col], pixel(row, col + 1)), 1))
+      best = min(cost for cost, direction in options)
+      costs[row][col] = best
+      dirs[row][col] = [direction for cost, direction in options if cost == best][0]
+  return costs, dirs
+def test_forward_energy_tables():
+  rng = np.random.default_rng(25)
+  image = rng.integers(0, 4, size=(7, 9, 3), dtype=np.uint8) * 60
+  costs, dirs = forward_energy_reference(image)
+  sc_spreadsheet = SeamCarve.from_array(image)
+  sc_spreadsheet.fill_forward_costs_dirs(image)
+  assert sc_spreadsheet.costs.tolist() == costs
+  assert sc_spreadsheet.dirs.tolist() == dirs
+def test_forward_energy_carving():
+  '''
+  each forward seam is the best one of the image it was
+   removed from, with its forward energy recorded
+  '''
+  rng = np.random.default_rng(26)
+  image = rng.integers(0, 256, size=(8, 11, 3), dtype=np.uint8)
+  carved_array, seams = carve(image, 7, energy_mode='forward')
+  assert carved_array.shape == (8, 7, 3)
+  current = image
+  for seam in seams:
+    costs, dirs = forward_energy_reference(current)
+    col = int(np.argmin(costs[0]))
+    expected = [col]
+    for row in range(7):
+      expected.append(expected[-1] + dirs[row][expected[-1]])
+    assert seam == expected
+    current = remove_seam(current, seam)
+  assert (current == carved_array).all()
+  with pytest.raises(ValueError):
+    carve(image, 7, energy_mode='sideways')
+
+
+'''
+Profiling
+'''
+def test_carve_stats():
+  '''
+  the stats see every stage and seam without changing
+   the result; a DP repair counts as a reuse of the tables
+  '''
+  from profiling import CarveStats
+  rng = np.random.default_rng(27)
+  image = rng.integers(0, 256, size=(10, 12, 3), dtype=np.uint8)
+  stats = CarveStats()
+  records = []
+  stats.on_seam(records.append)
+  carved_array, seams = carve(image, 8, incremental=True, stats=stats)
+  expected, expected_seams = carve(image, 8)
+  assert seams == expected_seams and (carved_array == expected).all()
+  assert len(records) == len(stats.seams) == 4
+  assert {'energy', 'dp', 'backtrack', 'removal'} <= set(stats.seconds)
+  assert stats.counters['table_reuse_hits'] == 3 and stats.hit_rate('table_reuse') == 0.75
+  assert records[0]['cells_relaxed'] == 10 * 12
+  assert sum(record['cells_relaxed'] for record in records) == stats.counters['cells_relaxed']
+  assert 'table reuse hit rate: 75.0%' in stats.report()
+
+  #widening records one seam per planned seam, with the planning DP as 'dp'
+  stats = CarveStats()
+  enlarged, seams = carve(image, 17, stats=stats)
+  assert len(stats.seams) == 5 and 'seams: 5' in stats.report()
+  assert stats.seams[0]['cells_relaxed'] == 10 * 12
+  assert {'energy', 'dp', 'backtrack', 'removal'} <= set(stats.seconds)
+
+
+'''
+Result cache
+'''
+def test_carve_cache(tmp_path, monkeypatch):
+  '''
+  results are carved once per (content, size, mode), evicted
+   least recently used first, and found again on disk
+  '''
+  import seamcarve
+  from carve_cache import CarveCache
+  rng = np.random.default_rng(28)
+  image = rng.integers(0, 256, size=(6, 9, 3), dtype=np.uint8)
+  cache = CarveCache(memory_budget=2 * 6 * 7 * 3, cache_dir=str(tmp_path))
+  result = cache.carve_array(image, 7)
+  assert (result == carve(image, 7)[0]).all() and not result.flags.writeable
+  assert cache.carve_array(image.copy(), 7) is result
+  forward = cache.carve_array(image, 7, energy_mode='forward')
+  assert (forward == carve(image, 7, energy_mode='forward')[0]).all()
+  cache.carve_array(image, 6)
+  assert (cache.hits, cache.misses, cache.evictions) == (1, 3, 1)
+
+  #a new cache (e.g. another process) finds the results on disk, and hits never carve
+  monkeypatch.setattr(seamcarve, 'carve', None)
+  cache = CarveCache(cache_dir=str(tmp_path))
+  assert (cache.carve_array(image, 7) == result).all()
+  assert (cache.hits, cache.disk_hits, cache.misses) == (1, 1, 0)
+def test_carve_cache_files(tmp_path):
+  '''
+  files are keyed by their bytes, and their importance values
+   are kept on disk for other target sizes
+  '''
+  from carve_cache import CarveCache, content_hash
+  from profiling import CarveStats
+  stats = CarveStats()
+  cache = CarveCache(cache_dir=str(tmp_path), stats=stats)
+  first = cache.carve_file("5x5_image.png", 3)
+  assert (first == SeamCarve("5x5_image.png").carve_seams(2)[0]).all()
+  assert cache.carve_file("5x5_image.png", 3) is first
+  with open("5x5_image.png", 'rb') as file:
+    digest = content_hash(file.read())
+  assert os.path.exists(cache.path(digest + '-energy'))
+  assert (cache.carve_file("5x5_image.png", 4, 4)
+          == carve(SeamCarve("5x5_image.png").image_array, 4, target_height=4)[0]).all()
+  assert stats.calls['decode'] == 2 and stats.hit_rate('cache') == 1 / 3
+
+
+'''
+All-pairs distance matrix
+'''
+def test_distance_matrix(tmp_path):
+  '''
+  every block of the pool's matrix matches CodeBreaker,
+   in shared memory or a memmap, with and without a cap
+  '''
+  from distance_matrix import distance_matrix
+  import random
+  rng = random.Random(33)
+  words = [''.join(rng.choice('abC') for ignored in range(rng.randint(0, 9)))
+           for ignored in range(23)]
+  others = words[:5] + ['', 'CAB', 'abcabcabc']
+  expected = np.array([[CodeBreaker(start, end).find_score() for end in words] for start in words])
+
+  matrix = distance_matrix(words, processes=2, block_size=5)
+  assert matrix.dtype == np.int32 and (matrix == expected).all()
+  capped = distance_matrix(words, cap=3, processes=2, block_size=4)
+  assert (capped == np.minimum(expected, 4)).all()
+  crossed = distance_matrix(words, others, processes=2, block_size=6,
+                            output=str(tmp_path / 'matrix.int32'))
+  assert isinstance(crossed, np.memmap) and crossed.shape == (23, 8)
+  assert crossed.tolist() == [[CodeBreaker(start, end).find_score() for end in others]
+                              for start in words]
@@ -0,0 +1,175 @@
+'''
+Temporally coherent seam carving of video, frame by frame.
+
+Consecutive frames of mostly static footage have nearly the same importance
+values and nearly the same seams, so a VideoCarver carries both over from one
+frame to the next instead of starting cold:
+
+- importance values are only recomputed around pixels that changed by more
+  than a threshold since they were last used (see update_energy), and
+- each seam is first searched in a band around the same seam of the previous
+  frame (see pyramid.band_seam); the full DP only runs when the band seam
+  costs noticeably more than the previous one, or when there is no previous
+  seam. Keeping seams near their previous position also keeps them from
+  jumping around between frames. A frame where nothing changed past the
+  threshold reuses the previous seams outright.
+'''
+import numpy as np
+from importance_calculator import EnergyMap, energy_map, pixel_energies
+from carving_buffer import CarvingBuffer
+from pyramid import band_seam
+
+
+def changed_pixels(frame, reference, threshold: int) -> np.ndarray:
+    '''
+    Returns:
+    a (height, width) bool mask of the pixels with an RGB channel that differs
+    by more than threshold between frame and reference
+    '''
+    return (np.abs(frame[:, :, :3].astype(np.int16) - reference[:, :, :3]) > threshold).any(axis=-1)
+
+
+def grow(mask) -> np.ndarray:
+    '''
+    Returns:
+    mask grown by one pixel in each of the four directions (the pixels whose
+    importance values depend on a pixel of mask)
+    '''
+    grown = mask.copy()
+    grown[1:] |= mask[:-1]
+    grown[:-1] |= mask[1:]
+    grown[:, 1:] |= mask[:, :-1]
+    grown[:, :-1] |= mask[:, 1:]
+    return grown
+
+
+class VideoCarver:
+    '''
+    Carves the frames of a clip to a common width, reusing the previous frame's
+    importance values and seams (see the module docstring).
+
+    Frames should all have the same size (a new size starts over cold). Counters
+    of the work done so far are kept in band_seams and full_seams (how each seam
+    was found), updated_pixels (importance values recomputed after the first
+    frame) and reused_frames (frames with no change past the threshold, which
+    simply reuse the previous frame's seams).
+    '''
+    def __init__(self, target_width: int, half_width: int = 4, degrade_ratio: float = 1.25,
+                 threshold: int = 8, workers: int = 1):
+        '''
+        Parameters:
+        target_width -- the width every frame is carved to
+        half_width -- band columns searched on each side of the previous seam
+        degrade_ratio -- a band seam costing more than this times the previous
+         frame's seam is replaced by a full DP search
+        threshold -- pixels whose channels all changed by at most this much keep
+         the importance values they had (0 recomputes on any change)
+        workers -- see SeamCarve.workers
+        '''
+        from seamcarve import SeamCarve
+        self.target_width = target_width
+        self.half_width = half_width
+        self.degrade_ratio = degrade_ratio
+        self.threshold = threshold
+        #a SeamCarve whose DP tables are reused for every full search
+        self.dp = SeamCarve.from_array(np.zeros((1, 1, 3), dtype=np.uint8))
+        self.dp.workers = workers
+        self.reference = None
+        self.values = None
+        self.seams = []
+        self.seam_costs = []
+        self.band_seams = 0
+        self.full_seams = 0
+        self.updated_pixels = 0
+        self.reused_frames = 0
+
+    def update_energy(self, frame) -> np.ndarray:
+        '''
+        Brings the importance values of the uncarved frame up to date, only
+         recomputing the pixels next to a change larger than threshold. The
+         reference frame those values were computed on is updated at the same
+         pixels, so slow drifts are caught once they add up.
+
+        Returns:
+        the (height, width) importance values, always those of the reference
+        frame
+        '''
+        if self.reference is None or self.reference.shape != frame.shape:
+            self.reference = np.array(frame)
+            self.values = energy_map(frame, self.dp.workers)
+            self.seams = []
+            self.seam_costs = []
+            return self.values
+        changed = changed_pixels(frame, self.reference, self.threshold)
+        self.reference[changed] = frame[changed]
+        rows, cols = np.nonzero(grow(changed))
+        self.values[rows, cols] = pixel_energies(self.reference, rows, cols)
+        self.updated_pixels += len(rows)
+        return self.values
+
+    def find_seam(self, vals, index: int):
+        '''
+        Finds the index'th seam of this frame, in a band around the previous
+         frame's index'th seam if there is one and it stays cheap enough
+
+        Returns:
+        a (seam, cost) tuple, the seam as an array of column ids
+        '''
+        height, width = vals.shape
+        band = 2 * self.half_width + 1
+        if index < len(self.seams) and band < width:
+            lo = np.clip(self.seams[index] - self.half_width, 0, width - band)
+            seam, cost = band_seam(np.take_along_axis(vals, lo[:, None] + np.arange(band), axis=1), lo)
+            if cost <= self.degrade_ratio * self.seam_costs[index]:
+                self.band_seams += 1
+                return np.array(seam), cost
+        seam = np.array(self.dp.find_least_important_seam(vals))
+        self.full_seams += 1
+        return seam, float(vals[np.arange(height), seam].sum())
+
+    def carve_frame(self, frame):
+        '''
+        Carves one frame to target_width, remembering its seams as the prior
+         for the next frame
+
+        Returns:
+        a (carved_array, seams) tuple like SeamCarve.carve_seams, carved_array
+        being a view of a buffer owned by this frame
+        '''
+        frame = np.asarray(frame)
+        seam_count = frame.shape[1] - self.target_width
+        if not 0 <= seam_count < frame.shape[1]:
+            raise ValueError("cannot carve a frame %d pixels wide to %d"
+                             % (frame.shape[1], self.target_width))
+        updated = self.updated_pixels
+        vals = self.update_energy(frame)
+        buffer = CarvingBuffer(frame)
+        if self.updated_pixels == updated and len(self.seams) == seam_count:
+            #nothing moved past the threshold: the previous seams still apply
+            for seam in self.seams:
+                buffer.remove_seam(seam)
+            self.reused_frames += 1
+            return buffer.view(), [seam.tolist() for seam in self.seams]
+        energy = EnergyMap(buffer.view(), vals.copy())
+        seams, costs = [], []
+        for index in range(seam_count):
+            seam, cost = self.find_seam(energy.values, index)
+            buffer.remove_seam(seam)
+            energy.remove_seam(buffer.view(), seam)
+            seams.append(seam)
+            costs.append(cost)
+        self.seams, self.seam_costs = seams, costs
+        return buffer.view(), [seam.tolist() for seam in seams]
+
+
+def carve_video(frames, target_width: int, **options):
+    '''
+    Carves every frame of an iterable of frames to target_width
+     (options are passed to VideoCarver)
+
+    Yields:
+    a (carved_array, seams) tuple per frame, see VideoCarver.carve_frame
+    '''
+    carver = VideoCarver(target_width, **options)
+    for frame in frames:
+        yield carver.carve_frame(frame)
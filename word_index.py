@@ -0,0 +1,174 @@
+'''
+A dictionary index for finding the words closest to a query, by CodeBreaker
+score (edit distance of the lower-cased words), without scoring every word.
+
+WordIndex is a BK-tree: every node holds a word and its children are keyed by
+their distance to it, so by the triangle inequality a search for words within
+k of a query at distance d of a node only has to visit the children whose key
+is between d - k and d + k. Words that are equal once lower-cased share one
+node.
+
+The tree is kept in compressed sparse row (CSR) form, flat lists of each
+node's children, which is also how it is saved: WordIndex.load reads an .npz
+file straight back into those lists.
+'''
+import heapq
+import numpy as np
+from codebreaker import bit_parallel_distance
+
+
+class WordIndex:
+    '''
+    A BK-tree over a list of words (see the module docstring).
+
+    Results are (score, word) tuples ordered by score, then by the word's
+    position in the list the index was built from, which is also the order a
+    brute force scoring of every word with a stable sort gives.
+    '''
+    def __init__(self, words, node_words, node_entries, child_offsets, child_distances, child_nodes):
+        '''
+        Wraps an already built tree; use build or load to make one
+
+        Parameters:
+        words -- the indexed words, as given
+        node_words -- the lower-cased word of each node (node 0 is the root)
+        node_entries -- for each node, the positions in words of the words it holds
+        child_offsets -- node i's children are entries child_offsets[i] to
+         child_offsets[i + 1] - 1 of child_distances and child_nodes
+        child_distances, child_nodes -- each child's distance to its parent, and its node
+        '''
+        self.words = words
+        self.node_words = node_words
+        self.node_entries = node_entries
+        self.child_offsets = child_offsets
+        self.child_distances = child_distances
+        self.child_nodes = child_nodes
+
+    @classmethod
+    def build(cls, words):
+        '''
+        Builds the index of a list of words in one go (inserting them in
+         order; the first word is the root)
+        '''
+        words = list(words)
+        node_words, node_entries, children = [], [], []
+        nodes = {}
+        for position, word in enumerate(words):
+            word_lower = word.lower()
+            if word_lower in nodes:
+                node_entries[nodes[word_lower]].append(position)
+                continue
+            new_node = len(node_words)
+            nodes[word_lower] = new_node
+            node_words.append(word_lower)
+            node_entries.append([position])
+            children.append({})
+            node = 0
+            while new_node:
+                distance = bit_parallel_distance(word_lower, node_words[node])
+                if distance not in children[node]:
+                    children[node][distance] = new_node
+                    break
+                node = children[node][distance]
+
+        child_offsets, child_distances, child_nodes = [0], [], []
+        for node_children in children:
+            for distance in sorted(node_children):
+                child_distances.append(distance)
+                child_nodes.append(node_children[distance])
+            child_offsets.append(len(child_nodes))
+        return cls(words, node_words, node_entries, child_offsets, child_distances, child_nodes)
+
+    def __len__(self) -> int:
+        return len(self.words)
+
+    def search(self, query: str, radius):
+        '''
+        Walks the tree, visiting only the nodes that can be within radius of
+         query; radius() is called before each node, so a search may narrow
+         it as it finds closer words
+
+        Yields:
+        a (score, node) tuple per visited node
+        '''
+        query = query.lower()
+        if not self.node_words:
+            return
+        stack = [0]
+        while stack:
+            node = stack.pop()
+            score = bit_parallel_distance(query, self.node_words[node])
+            yield score, node
+            limit = radius()
+            for child in range(self.child_offsets[node], self.child_offsets[node + 1]):
+                if abs(self.child_distances[child] - score) <= limit:
+                    stack.append(self.child_nodes[child])
+
+    def within(self, query: str, max_distance: int) -> list:
+        '''
+        Returns:
+        every indexed word scoring at most max_distance against query, as
+        (score, word) tuples (see the class docstring for the order)
+        '''
+        found = []
+        for score, node in self.search(query, lambda: max_distance):
+            if score <= max_distance:
+                found.extend((score, position) for position in self.node_entries[node])
+        return [(score, self.words[position]) for score, position in sorted(found)]
+
+    def nearest(self, query: str, count: int = 1) -> list:
+        '''
+        Returns:
+        the count indexed words scoring lowest against query, as (score, word)
+        tuples (see the class docstring for the order and ties)
+        '''
+        if count <= 0:
+            return []
+        #a max heap (negated) of the best count (score, position) pairs so far
+        best = []
+        radius = lambda: -best[0][0] if len(best) >= count else float('inf')
+        for score, node in self.search(query, radius):
+            for position in self.node_entries[node]:
+                if len(best) < count:
+                    heapq.heappush(best, (-score, -position))
+                elif (score, position) < (-best[0][0], -best[0][1]):
+                    heapq.heapreplace(best, (-score, -position))
+                else:
+                    break
+        found = sorted((-score, -position) for score, position in best)
+        return [(score, self.words[position]) for score, position in found]
+
+    def save(self, path: str):
+        '''
+        Writes the index to an .npz file: the words as one UTF-8 buffer with
+        offsets, and the node and child lists as CSR arrays
+        '''
+        encoded = [word.encode('utf-8') for word in self.words]
+        entry_offsets = np.cumsum([0] + [len(entries) for entries in self.node_entries])
+        np.savez(path,
+                 word_bytes=np.frombuffer(b''.join(encoded), dtype=np.uint8),
+                 word_offsets=np.cumsum([0] + [len(word) for word in encoded]),
+                 entry_offsets=entry_offsets,
+                 entries=np.array([position for entries in self.node_entries for position in entries],
+                                  dtype=np.int64),
+                 child_offsets=np.array(self.child_offsets, dtype=np.int64),
+                 child_distances=np.array(self.child_distances, dtype=np.int64),
+                 child_nodes=np.array(self.child_nodes, dtype=np.int64))
+
+    @classmethod
+    def load(cls, path: str):
+        '''
+        Reads an index written by save
+        '''
+        with np.load(path) as stored:
+            data = stored['word_bytes'].tobytes()
+            word_offsets = stored['word_offsets'].tolist()
+            entry_offsets = stored['entry_offsets'].tolist()
+            entries = stored['entries'].tolist()
+            child_offsets = stored['child_offsets'].tolist()
+            child_distances = stored['child_distances'].tolist()
+            child_nodes = stored['child_nodes'].tolist()
+        words = [data[start:end].decode('utf-8') for start, end in zip(word_offsets, word_offsets[1:])]
+        node_entries = [entries[start:end] for start, end in zip(entry_offsets, entry_offsets[1:])]
+        node_words = [words[positions[0]].lower() for positions in node_entries]
+        return cls(words, node_words, node_entries, child_offsets, child_distances, child_nodes)